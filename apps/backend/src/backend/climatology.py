@@ -0,0 +1,377 @@
+"""Precomputed monthly climatology of TEMP/PSAL on a lon x lat x depth grid.
+
+The cube holds count/sum/min/max for every (calendar month, standard pressure
+bin, grid cell) over the Indian Ocean, one ``.npy`` file per variable and
+statistic. The files are memory-mapped, so an aggregate question ("average
+temperature in the Arabian Sea in March") is answered by slicing arrays
+instead of downloading profiles, and every worker process shares the same
+pages of the OS cache.
+
+Build or refresh the cube offline:
+
+    python -m backend.climatology --start 2015-01-01 --end 2024-12-31
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import os
+import shutil
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .datastore import create_data_source
+from .ingest import month_ranges, sub_boxes
+
+# Standard pressure bin edges (dbar), shared with the per-request depth stats
+STANDARD_PRESSURE_BINS = [
+    0, 10, 20, 30, 50, 75, 100, 125, 150, 200, 250, 300, 400, 500,
+    600, 700, 800, 900, 1000, 1200, 1400, 1600, 1800, 2000,
+]
+CLIMATOLOGY_VARIABLES = ["TEMP", "PSAL"]
+CLIMATOLOGY_STATS = ["count", "sum", "min", "max"]
+ARGO_CLIMATOLOGY_DIR = os.getenv("ARGO_CLIMATOLOGY_DIR", "./climatology")
+# Indian Ocean grid covered by the cube
+CLIMATOLOGY_GRID = {
+    "lon_min": float(os.getenv("ARGO_CLIMATOLOGY_LON_MIN", "20")),
+    "lon_max": float(os.getenv("ARGO_CLIMATOLOGY_LON_MAX", "150")),
+    "lat_min": float(os.getenv("ARGO_CLIMATOLOGY_LAT_MIN", "-70")),
+    "lat_max": float(os.getenv("ARGO_CLIMATOLOGY_LAT_MAX", "30")),
+    "cell_deg": float(os.getenv("ARGO_CLIMATOLOGY_CELL_DEG", "1.0")),
+}
+CLIMATOLOGY_BUILD_WORKERS = int(os.getenv("ARGO_CLIMATOLOGY_BUILD_WORKERS", "4"))
+
+
+def pressure_bin_index(pres: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Index of the pressure bin of each value, or -1 outside the bins."""
+    index = np.searchsorted(edges, pres, side="right") - 1
+    # The last edge belongs to the deepest bin
+    index[pres == edges[-1]] = len(edges) - 2
+    index[~np.isfinite(pres) | (pres < edges[0]) | (pres > edges[-1])] = -1
+    return index
+
+
+def _rounded(values: np.ndarray) -> List[Any]:
+    # JSON-ready nested lists, with empty cells as None
+    values = np.asarray(values, dtype="float64")
+    out = np.round(values, 3).astype(object)
+    out[~np.isfinite(values)] = None
+    return out.tolist()
+
+
+def _grid_shape(grid: Dict[str, float], n_bins: int) -> tuple:
+    n_lat = int(round((grid["lat_max"] - grid["lat_min"]) / grid["cell_deg"]))
+    n_lon = int(round((grid["lon_max"] - grid["lon_min"]) / grid["cell_deg"]))
+    return (12, n_bins, n_lat, n_lon)
+
+
+class ClimatologyBuilder:
+    """Accumulates raw Argo rows into the flat climatology arrays."""
+
+    def __init__(
+        self,
+        grid: Dict[str, float] = CLIMATOLOGY_GRID,
+        bins: List[float] = STANDARD_PRESSURE_BINS,
+    ):
+        self.grid = grid
+        self.edges = np.asarray(bins, dtype="float64")
+        self.shape = _grid_shape(grid, len(bins) - 1)
+        size = int(np.prod(self.shape))
+        self.rows = 0
+        self.arrays = {
+            var: {
+                "count": np.zeros(size, dtype="int64"),
+                "sum": np.zeros(size, dtype="float64"),
+                "min": np.full(size, np.inf),
+                "max": np.full(size, -np.inf),
+            }
+            for var in CLIMATOLOGY_VARIABLES
+        }
+
+    def add(self, ds: pd.DataFrame) -> None:
+        if ds.empty or "PRES" not in ds.columns:
+            return
+        _, n_bins, n_lat, n_lon = self.shape
+        cell = self.grid["cell_deg"]
+        month = ds["TIME"].dt.month.to_numpy(dtype="float64", na_value=np.nan) - 1
+        pbin = pressure_bin_index(ds["PRES"].to_numpy(dtype="float64", na_value=np.nan), self.edges)
+        iy = np.floor((ds["LATITUDE"].to_numpy(dtype="float64") - self.grid["lat_min"]) / cell)
+        ix = np.floor((ds["LONGITUDE"].to_numpy(dtype="float64") - self.grid["lon_min"]) / cell)
+        valid = (
+            np.isfinite(month)
+            & (pbin >= 0)
+            & (iy >= 0) & (iy < n_lat)
+            & (ix >= 0) & (ix < n_lon)
+        )
+        flat = np.zeros(len(ds), dtype="int64")
+        flat[valid] = (
+            (month[valid].astype("int64") * n_bins + pbin[valid]) * n_lat
+            + iy[valid].astype("int64")
+        ) * n_lon + ix[valid].astype("int64")
+
+        for var, arrays in self.arrays.items():
+            if var not in ds.columns:
+                continue
+            values = ds[var].to_numpy(dtype="float64", na_value=np.nan)
+            ok = valid & np.isfinite(values)
+            index, values = flat[ok], values[ok]
+            size = len(arrays["count"])
+            arrays["count"] += np.bincount(index, minlength=size)
+            arrays["sum"] += np.bincount(index, weights=values, minlength=size)
+            np.minimum.at(arrays["min"], index, values)
+            np.maximum.at(arrays["max"], index, values)
+        self.rows += int(valid.sum())
+
+    def save(self, directory: str, meta: Dict[str, Any]) -> None:
+        """Write the cube next to ``directory`` and swap it into place."""
+        tmp_dir = directory + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for var, arrays in self.arrays.items():
+            empty = arrays["count"] == 0
+            out = {
+                "count": arrays["count"].astype("int32"),
+                "sum": arrays["sum"].astype("float32"),
+                "min": np.where(empty, np.nan, arrays["min"]).astype("float32"),
+                "max": np.where(empty, np.nan, arrays["max"]).astype("float32"),
+            }
+            for stat, values in out.items():
+                np.save(os.path.join(tmp_dir, f"{var}_{stat}.npy"), values.reshape(self.shape))
+        meta = {
+            **meta,
+            "grid": self.grid,
+            "shape": list(self.shape),
+            "pres_bins": self.edges.tolist(),
+            "variables": list(self.arrays),
+            "rows": self.rows,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+        old_dir = directory + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old_dir)
+        os.replace(tmp_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class ClimatologyCube:
+    """Read-only view of a built cube, sliced straight from memory-mapped files."""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.grid = self.meta["grid"]
+        self.edges = self.meta["pres_bins"]
+        self.hits = 0
+        self.arrays = {
+            var: {
+                stat: np.load(os.path.join(directory, f"{var}_{stat}.npy"), mmap_mode="r")
+                for stat in CLIMATOLOGY_STATS
+            }
+            for var in self.meta["variables"]
+        }
+
+    @classmethod
+    def load(cls, directory: str = ARGO_CLIMATOLOGY_DIR) -> Optional["ClimatologyCube"]:
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            print(f"No climatology cube at {directory}; aggregate queries fetch profiles")
+            return None
+        cube = cls(directory)
+        print(f"Loaded climatology cube {cube.meta['shape']} from {directory}")
+        return cube
+
+    def covers(self, box: Dict[str, float]) -> bool:
+        return (
+            box["lon_min"] >= self.grid["lon_min"]
+            and box["lon_max"] <= self.grid["lon_max"]
+            and box["lat_min"] >= self.grid["lat_min"]
+            and box["lat_max"] <= self.grid["lat_max"]
+        )
+
+    def aggregate(
+        self, box: Dict[str, float], months: List[int], variables: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Depth statistics for a box over calendar ``months`` (1-12).
+
+        Returns the same layout as the per-request depth statistics, or None
+        when the cube holds no observations there.
+        """
+        cell = self.grid["cell_deg"]
+        _, _, n_lat, n_lon = self.meta["shape"]
+        iy0 = max(int(np.floor((box["lat_min"] - self.grid["lat_min"]) / cell)), 0)
+        iy1 = min(int(np.ceil((box["lat_max"] - self.grid["lat_min"]) / cell)), n_lat)
+        ix0 = max(int(np.floor((box["lon_min"] - self.grid["lon_min"]) / cell)), 0)
+        ix1 = min(int(np.ceil((box["lon_max"] - self.grid["lon_min"]) / cell)), n_lon)
+        month_index = sorted({m - 1 for m in months})
+        variables = [v for v in variables if v in self.arrays]
+        if iy1 <= iy0 or ix1 <= ix0 or not month_index or not variables:
+            return None
+
+        window = {}
+        for var in variables:
+            # Basic slicing keeps the memmap; only the selected months are copied
+            arrays = {
+                stat: self.arrays[var][stat][:, :, iy0:iy1, ix0:ix1][month_index]
+                for stat in CLIMATOLOGY_STATS
+            }
+            window[var] = {
+                "count": arrays["count"].sum(axis=0, dtype="int64"),
+                "sum": arrays["sum"].sum(axis=0, dtype="float64"),
+                "min": np.fmin.reduce(arrays["min"], axis=0),
+                "max": np.fmax.reduce(arrays["max"], axis=0),
+            }
+
+        # (bin, lat, lon) -> cells with data, each with one value per bin
+        has_data = np.any([w["count"].sum(axis=0) > 0 for w in window.values()], axis=0)
+        if not has_data.any():
+            return None
+        iy, ix = np.nonzero(has_data)
+        stats: Dict[str, Any] = {
+            "pres_bins": self.edges,
+            "variables": variables,
+            "overall": {},
+            "cells": {
+                "cell_deg": cell,
+                "lon": (self.grid["lon_min"] + (ix0 + ix + 0.5) * cell).tolist(),
+                "lat": (self.grid["lat_min"] + (iy0 + iy + 0.5) * cell).tolist(),
+            },
+            "climatology": {
+                "months": [m + 1 for m in month_index],
+                "period": [self.meta.get("start"), self.meta.get("end")],
+            },
+        }
+        for var, w in window.items():
+            count = w["count"][:, iy, ix].T.astype("float64")
+            mean = w["sum"][:, iy, ix].T / np.where(count > 0, count, np.nan)
+            stats["cells"][var] = {
+                "mean": _rounded(mean),
+                "min": _rounded(w["min"][:, iy, ix].T),
+                "max": _rounded(w["max"][:, iy, ix].T),
+                "count": count.astype("int64").tolist(),
+            }
+            total = w["count"].sum(axis=(1, 2))
+            stats["overall"][var] = {
+                "mean": _rounded(
+                    w["sum"].sum(axis=(1, 2)) / np.where(total > 0, total, np.nan)
+                ),
+                "min": _rounded(np.fmin.reduce(w["min"].reshape(len(total), -1), axis=1)),
+                "max": _rounded(np.fmax.reduce(w["max"].reshape(len(total), -1), axis=1)),
+                "count": total.tolist(),
+            }
+        self.hits += 1
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shape": self.meta["shape"],
+            "period": [self.meta.get("start"), self.meta.get("end")],
+            "built_at": self.meta.get("built_at"),
+            "hits": self.hits,
+        }
+
+
+def _fetch_month(
+    source, box: Dict[str, float], start: str, end: str, outer: Dict[str, float]
+) -> pd.DataFrame:
+    try:
+        ds = source.fetch_region(box, start, end)
+    except FileNotFoundError:
+        return pd.DataFrame()
+    if ds.empty:
+        return ds
+    # Adjacent sub-boxes share edges and both return the rows on them; keep
+    # those only in the box below/left of the edge, so each row is binned once
+    keep = np.ones(len(ds), dtype=bool)
+    if box["lon_max"] < outer["lon_max"]:
+        keep &= ds["LONGITUDE"].to_numpy() < box["lon_max"]
+    if box["lat_max"] < outer["lat_max"]:
+        keep &= ds["LATITUDE"].to_numpy() < box["lat_max"]
+    return ds[keep]
+
+
+async def build(
+    source_name: str,
+    start: datetime.date,
+    end: datetime.date,
+    directory: str = ARGO_CLIMATOLOGY_DIR,
+    workers: int = CLIMATOLOGY_BUILD_WORKERS,
+    region_deg: float = 10.0,
+) -> Dict[str, Any]:
+    builder = ClimatologyBuilder()
+    source = create_data_source(source_name)
+    await source.start()
+    box = {k: CLIMATOLOGY_GRID[k] for k in ("lon_min", "lon_max", "lat_min", "lat_max")}
+    tasks = [
+        (sub_box, month_start, month_end)
+        for month_start, month_end in month_ranges(start, end)
+        for sub_box in sub_boxes(box, region_deg)
+    ]
+    print(f"Building climatology from {len(tasks)} month/region chunks ({start} to {end})")
+
+    loop = asyncio.get_running_loop()
+    started = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Like the ingest, keep only workers * 2 fetches in flight so
+            # finished frames don't pile up faster than they are binned
+            pending = collections.deque()
+            queued = iter(tasks)
+            for task in itertools.islice(queued, workers * 2):
+                pending.append(
+                    loop.run_in_executor(executor, _fetch_month, source, *task, box)
+                )
+            done = 0
+            while pending:
+                ds = await pending.popleft()
+                for task in itertools.islice(queued, 1):
+                    pending.append(
+                        loop.run_in_executor(executor, _fetch_month, source, *task, box)
+                    )
+                builder.add(ds)
+                done += 1
+                if done % 50 == 0 or done == len(tasks):
+                    print(f"[{done}/{len(tasks)}] {builder.rows} rows binned")
+    finally:
+        await source.close()
+
+    builder.save(
+        directory,
+        {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "source": source_name,
+            "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+    )
+    return {"rows": builder.rows, "seconds": round(time.time() - started, 2)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--source", choices=["argopy", "gdac", "postgres", "sqlite"], default="argopy"
+    )
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True)
+    parser.add_argument("--end", type=datetime.date.fromisoformat, required=True)
+    parser.add_argument("--dir", default=ARGO_CLIMATOLOGY_DIR)
+    parser.add_argument("--workers", type=int, default=CLIMATOLOGY_BUILD_WORKERS)
+    parser.add_argument("--region-deg", type=float, default=10.0)
+    args = parser.parse_args(argv)
+    print(
+        asyncio.run(
+            build(args.source, args.start, args.end, args.dir, args.workers, args.region_deg)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
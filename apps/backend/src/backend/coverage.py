@@ -0,0 +1,133 @@
+"""In-memory index of where and when Argo profiles exist.
+
+``CoverageIndex`` holds the number of profiles per lat/lon cell per month as a
+small dense array, built from the data source's profile positions (the GDAC
+index or the local table). It answers "how many profiles are in this box and
+date range" without any network round trip, which lets requests for empty
+regions fail immediately and lets sparse boxes be widened just enough before
+anything is fetched.
+"""
+
+import datetime
+import math
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+ARGO_COVERAGE_CELL_DEG = float(os.getenv("ARGO_COVERAGE_CELL_DEG", "1.0"))
+# Boxes are widened one cell at a time until they reach this many profiles
+ARGO_COVERAGE_TARGET_PROFILES = int(os.getenv("ARGO_COVERAGE_TARGET_PROFILES", "10"))
+ARGO_COVERAGE_MAX_EXPAND_DEG = float(os.getenv("ARGO_COVERAGE_MAX_EXPAND_DEG", "5"))
+
+
+def _month_number(date: datetime.date) -> int:
+    return date.year * 12 + date.month - 1
+
+
+class CoverageIndex:
+    """Profile counts per (month, lat cell, lon cell).
+
+    Counts saturate at 65535 so the grid fits in uint16: one degree cells over
+    25 years of months take about 40 MB.
+    """
+
+    def __init__(
+        self, positions: pd.DataFrame, cell_deg: float = ARGO_COVERAGE_CELL_DEG
+    ):
+        self.cell_deg = cell_deg
+        self.n_lat = int(math.ceil(180 / cell_deg))
+        self.n_lon = int(math.ceil(360 / cell_deg))
+        self.built_at = datetime.datetime.now()
+
+        times = pd.to_datetime(positions["TIME"])
+        month = (times.dt.year * 12 + times.dt.month - 1).to_numpy(dtype="int64")
+        self.first_month = int(month.min())
+        self.last_month = int(month.max())
+        self.profiles = len(positions)
+        iy, ix = self._cells(
+            positions["LATITUDE"].to_numpy(dtype="float64"),
+            positions["LONGITUDE"].to_numpy(dtype="float64"),
+        )
+        n_months = self.last_month - self.first_month + 1
+        flat = ((month - self.first_month) * self.n_lat + iy) * self.n_lon + ix
+        counts = np.bincount(flat, minlength=n_months * self.n_lat * self.n_lon)
+        self.counts = np.minimum(counts, np.iinfo("uint16").max).astype("uint16").reshape(
+            n_months, self.n_lat, self.n_lon
+        )
+
+    def _cells(self, lat: np.ndarray, lon: np.ndarray) -> tuple:
+        iy = np.clip(((lat + 90) // self.cell_deg).astype("int64"), 0, self.n_lat - 1)
+        ix = np.clip(((lon + 180) // self.cell_deg).astype("int64"), 0, self.n_lon - 1)
+        return iy, ix
+
+    def covers(self, date_end: str) -> bool:
+        """Whether the index is recent enough to speak for this date range.
+
+        The last indexed month may still be filling up, and later months may
+        have profiles the index has not seen yet, so those ranges are left to
+        a real fetch.
+        """
+        return _month_number(datetime.date.fromisoformat(date_end)) < self.last_month
+
+    def count(self, box: Dict[str, float], date_start: str, date_end: str) -> int:
+        """Profiles in the cells overlapping ``box`` over the months of the range.
+
+        Cells are counted whole, so this is an upper bound: zero means the box
+        certainly holds no profiles.
+        """
+        m0 = _month_number(datetime.date.fromisoformat(date_start)) - self.first_month
+        m1 = _month_number(datetime.date.fromisoformat(date_end)) - self.first_month
+        m0, m1 = max(m0, 0), min(m1, self.counts.shape[0] - 1)
+        if m1 < m0:
+            return 0
+        (iy0, iy1), (ix0, ix1) = self._cells(
+            np.array([box["lat_min"], box["lat_max"]]),
+            np.array([box["lon_min"], box["lon_max"]]),
+        )
+        window = self.counts[m0 : m1 + 1, iy0 : iy1 + 1, ix0 : ix1 + 1]
+        return int(window.sum(dtype="int64"))
+
+    def expand(
+        self,
+        box: Dict[str, float],
+        date_start: str,
+        date_end: str,
+        target: int = ARGO_COVERAGE_TARGET_PROFILES,
+        max_margin: float = ARGO_COVERAGE_MAX_EXPAND_DEG,
+    ) -> Dict[str, Any]:
+        """Widen ``box`` one cell at a time until it holds ``target`` profiles.
+
+        Returns the box to fetch, its profile count and the margin used. If
+        even the widest box is empty, ``box`` is None.
+        """
+        margin = 0.0
+        while True:
+            candidate = {
+                "lon_min": max(-180, box["lon_min"] - margin),
+                "lon_max": min(180, box["lon_max"] + margin),
+                "lat_min": max(-90, box["lat_min"] - margin),
+                "lat_max": min(90, box["lat_max"] + margin),
+            }
+            profiles = self.count(candidate, date_start, date_end)
+            if profiles >= target or margin + self.cell_deg > max_margin:
+                break
+            margin += self.cell_deg
+        return {
+            "box": candidate if profiles else None,
+            "profiles": profiles,
+            "margin": margin,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "profiles": self.profiles,
+            "months": [
+                f"{self.first_month // 12}-{self.first_month % 12 + 1:02d}",
+                f"{self.last_month // 12}-{self.last_month % 12 + 1:02d}",
+            ],
+            "cell_deg": self.cell_deg,
+            "bytes": self.counts.nbytes,
+            "built_at": self.built_at.isoformat(timespec="seconds"),
+        }
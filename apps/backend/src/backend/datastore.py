@@ -0,0 +1,751 @@
+"""Pluggable sources of raw Argo profiles.
+
+Every source returns a DataFrame in argopy's column layout (LATITUDE,
+LONGITUDE, TIME, PRES, TEMP, PSAL, ...) so the rest of the backend does not
+care where the rows came from. The source is chosen per deployment with
+ARGO_DATA_SOURCE:
+
+- ``argopy`` (default): download from the Argo servers through argopy
+- ``postgres``: the ``argo_float_data`` table described in tools.yaml, read
+  through an asyncpg connection pool
+- ``sqlite``: the same table in a local SQLite file, a stand-in for Postgres
+  in development and tests
+- ``gdac``: a local mirror of the Argo GDAC, found through its
+  ``ar_index_global_prof.txt`` profile index
+"""
+
+import os
+import re
+import asyncio
+import sqlite3
+import threading
+import datetime
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import aiohttp
+import yaml
+from fsspec.exceptions import FSTimeoutError
+from scipy.io import netcdf_file
+
+# Argopy import (used to fetch Argo profiles)
+from argopy import DataFetcher as ArgoDataFetcher
+
+TOOLS_YAML_PATH = os.getenv(
+    "ARGO_TOOLS_YAML",
+    os.path.join(os.path.dirname(__file__), "..", "..", "tools.yaml"),
+)
+REGION_TOOL = "get_profiles_in_region"
+POSITIONS_TOOL = "get_profile_positions"
+POSTGRES_SOURCE = "argo-postgres-source"
+POSTGRES_POOL_MIN = int(os.getenv("ARGO_POSTGRES_POOL_MIN", "1"))
+POSTGRES_POOL_MAX = int(os.getenv("ARGO_POSTGRES_POOL_MAX", "10"))
+POSTGRES_QUERY_TIMEOUT = float(os.getenv("ARGO_POSTGRES_QUERY_TIMEOUT", "30"))
+
+# argo_float_data column -> argopy DataFrame column
+TABLE_TO_ARGO_COLUMNS = {
+    "platform_number": "PLATFORM_NUMBER",
+    "cycle_number": "CYCLE_NUMBER",
+    "reference_date_time": "TIME",
+    "latitude": "LATITUDE",
+    "longitude": "LONGITUDE",
+    "pres": "PRES",
+    "temp": "TEMP",
+    "psal": "PSAL",
+    "pres_qc": "PRES_QC",
+    "temp_qc": "TEMP_QC",
+    "psal_qc": "PSAL_QC",
+}
+NUMERIC_ARGO_COLUMNS = ["LATITUDE", "LONGITUDE", "PRES", "TEMP", "PSAL"]
+
+# argopy upstreams, in order of preference until latencies are known
+ARGO_UPSTREAM_SOURCES = [
+    s.strip() for s in os.getenv("ARGO_UPSTREAM_SOURCES", "erddap,gdac,argovis").split(",")
+]
+# Weight of the newest sample in the moving average of latency
+ARGO_UPSTREAM_EWMA_ALPHA = float(os.getenv("ARGO_UPSTREAM_EWMA_ALPHA", "0.3"))
+# Consecutive failures that open a source's circuit, and for how long
+ARGO_UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("ARGO_UPSTREAM_FAILURE_THRESHOLD", "3"))
+ARGO_UPSTREAM_COOLDOWN = float(os.getenv("ARGO_UPSTREAM_COOLDOWN_SECONDS", "120"))
+# Errors that count against an upstream (an empty region is not one of them)
+UPSTREAM_ERRORS = (FSTimeoutError, aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+# Local GDAC mirror: <ARGO_GDAC_PATH>/ar_index_global_prof.txt and dac/...
+ARGO_GDAC_PATH = os.getenv("ARGO_GDAC_PATH", "./gdac")
+GDAC_INDEX_FILE = "ar_index_global_prof.txt"
+GDAC_INDEX_CELL_DEG = float(os.getenv("ARGO_GDAC_INDEX_CELL_DEG", "1.0"))
+GDAC_MAX_WORKERS = int(os.getenv("ARGO_GDAC_MAX_WORKERS", "8"))
+GDAC_PARAMETERS = ["PRES", "TEMP", "PSAL"]
+# Profile index used for the positions of argopy's data (local path or URL)
+ARGO_PROFILE_INDEX_URL = os.getenv(
+    "ARGO_PROFILE_INDEX_URL", "https://data-argo.ifremer.fr/ar_index_global_prof.txt.gz"
+)
+# JULD in Argo files counts days from this date
+ARGO_REFERENCE_DATE = np.datetime64("1950-01-01T00:00:00", "s")
+
+
+def load_tools_config(path: str = TOOLS_YAML_PATH) -> Dict[str, Any]:
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+class ArgoDataSource:
+    """Base class: ``fetch_region`` returns the rows inside a box and date range.
+
+    ``fetch_region`` is blocking and is called from executor threads. An empty
+    region raises FileNotFoundError, like argopy does.
+    """
+
+    name = "base"
+    # Whether results should go through the on-disk tile cache
+    cacheable = False
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def fetch_region(
+        self, box: Dict[str, float], date_start: str, date_end: str
+    ) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def profile_positions(self) -> pd.DataFrame:
+        """LATITUDE/LONGITUDE/TIME of every profile the source can serve."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name}
+
+
+def read_profile_index(path: str, files: bool = True) -> pd.DataFrame:
+    """Read a GDAC ``ar_index_global_prof.txt`` (optionally gzipped, or a URL).
+
+    Returns the TIME, LATITUDE and LONGITUDE of every profile with a valid
+    date and position, plus its ``file`` path unless ``files`` is False. The
+    YYYYMMDDHHMMSS dates are read as numbers and split arithmetically, which
+    is much faster than parsing millions of strings.
+    """
+    columns = ["date", "latitude", "longitude"] + (["file"] if files else [])
+    index = pd.read_csv(
+        path,
+        comment="#",
+        usecols=columns,
+        dtype={"file": str, "date": "float64", "latitude": "float64", "longitude": "float64"},
+    )
+    date = index["date"].fillna(0).to_numpy().astype("int64")
+    times = pd.to_datetime(
+        pd.DataFrame(
+            {
+                "year": date // 10**10,
+                "month": date // 10**8 % 100,
+                "day": date // 10**6 % 100,
+                "hour": date // 10**4 % 100,
+                "minute": date // 100 % 100,
+                "second": date % 100,
+            }
+        ),
+        errors="coerce",
+    )
+    keep = (
+        times.notna()
+        & index["latitude"].between(-90, 90)
+        & index["longitude"].between(-180, 180)
+    )
+    positions = pd.DataFrame(
+        {
+            "TIME": times[keep],
+            "LATITUDE": index["latitude"][keep],
+            "LONGITUDE": index["longitude"][keep],
+        }
+    )
+    if files:
+        positions.insert(0, "file", index["file"][keep])
+    return positions.reset_index(drop=True)
+
+
+class UpstreamSelector:
+    """Chooses the argopy upstream (erddap, gdac, argovis) for each fetch.
+
+    Every source keeps a moving average of its latency, its error and timeout
+    counts and a circuit breaker: after ``failure_threshold`` consecutive
+    failures the source is skipped for ``cooldown`` seconds, then one request
+    is let through as a probe (half-open) and its outcome closes or reopens
+    the circuit. Healthy sources are tried fastest first; sources without a
+    latency yet keep their configured order ahead of measured ones, so each
+    gets measured.
+    """
+
+    def __init__(
+        self,
+        sources: List[str] = ARGO_UPSTREAM_SOURCES,
+        alpha: float = ARGO_UPSTREAM_EWMA_ALPHA,
+        failure_threshold: int = ARGO_UPSTREAM_FAILURE_THRESHOLD,
+        cooldown: float = ARGO_UPSTREAM_COOLDOWN,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.sources = {
+            name: {
+                "state": "closed",
+                "latency": None,
+                "requests": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "consecutive_failures": 0,
+                "opened_at": None,
+                "probing": False,
+            }
+            for name in sources
+        }
+
+    def ranked(self) -> List[str]:
+        """Sources to try for the next fetch, best first."""
+        now = time.time()
+        with self._lock:
+            healthy, probes, open_sources = [], [], []
+            for order, (name, source) in enumerate(self.sources.items()):
+                if source["state"] == "open" and now - source["opened_at"] >= self.cooldown:
+                    source["state"] = "half_open"
+                if source["state"] == "closed":
+                    latency = source["latency"]
+                    healthy.append((latency is not None, latency or 0.0, order, name))
+                elif source["state"] == "half_open" and not source["probing"]:
+                    source["probing"] = True
+                    probes.append(name)
+                else:
+                    open_sources.append((source["opened_at"] or 0.0, name))
+            # A due probe goes first so a recovered source is noticed; open
+            # sources are a last resort, oldest failure first
+            return (
+                probes
+                + [name for *_, name in sorted(healthy)]
+                + [name for _, name in sorted(open_sources)]
+            )
+
+    def record(
+        self, name: str, latency: float, error: Optional[BaseException] = None
+    ) -> None:
+        with self._lock:
+            source = self.sources[name]
+            source["requests"] += 1
+            source["probing"] = False
+            if error is None:
+                previous = source["latency"]
+                source["latency"] = (
+                    latency
+                    if previous is None
+                    else self.alpha * latency + (1 - self.alpha) * previous
+                )
+                source["consecutive_failures"] = 0
+                source["state"] = "closed"
+                return
+            source["errors"] += 1
+            if isinstance(error, (FSTimeoutError, asyncio.TimeoutError)):
+                source["timeouts"] += 1
+            source["consecutive_failures"] += 1
+            if (
+                source["state"] == "half_open"
+                or source["consecutive_failures"] >= self.failure_threshold
+            ):
+                source["state"] = "open"
+                source["opened_at"] = time.time()
+
+    def release(self, name: str) -> None:
+        # The request ended without saying anything about the source's health
+        with self._lock:
+            self.sources[name]["probing"] = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    "state": source["state"],
+                    "latency_s": (
+                        round(source["latency"], 3)
+                        if source["latency"] is not None
+                        else None
+                    ),
+                    "requests": source["requests"],
+                    "errors": source["errors"],
+                    "timeouts": source["timeouts"],
+                    "error_rate": (
+                        round(source["errors"] / source["requests"], 3)
+                        if source["requests"]
+                        else None
+                    ),
+                }
+                for name, source in self.sources.items()
+            }
+
+
+class ArgopySource(ArgoDataSource):
+    """Argo servers through argopy, routed by an ``UpstreamSelector``.
+
+    A fetch that fails with a network error or timeout is retried on the next
+    source in the ranking.
+    """
+
+    name = "argopy"
+    cacheable = True
+
+    def __init__(self, selector: Optional[UpstreamSelector] = None):
+        self.selector = selector or UpstreamSelector()
+
+    def fetch_region(
+        self, box: Dict[str, float], date_start: str, date_end: str
+    ) -> pd.DataFrame:
+        region = [
+            box["lon_min"],
+            box["lon_max"],
+            box["lat_min"],
+            box["lat_max"],
+            0,
+            2000,
+            date_start,
+            date_end,
+        ]
+        last_error: Optional[BaseException] = None
+        for src in self.selector.ranked():
+            started = time.time()
+            try:
+                argo = ArgoDataFetcher(src=src)
+                ds = argo.region(region).to_dataframe()
+            except FileNotFoundError:
+                # An empty region is a valid answer from a healthy source
+                self.selector.record(src, time.time() - started)
+                raise
+            except UPSTREAM_ERRORS as e:
+                self.selector.record(src, time.time() - started, e)
+                print(f"Argo source {src} failed ({type(e).__name__}), trying the next one")
+                last_error = e
+                continue
+            except Exception:
+                self.selector.release(src)
+                raise
+            self.selector.record(src, time.time() - started)
+            return ds
+        if last_error is None:
+            # Only when no upstream is configured at all
+            raise RuntimeError("no healthy argopy upstream")
+        raise last_error
+
+    def profile_positions(self) -> pd.DataFrame:
+        return read_profile_index(ARGO_PROFILE_INDEX_URL, files=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "upstreams": self.selector.stats()}
+
+
+def _region_params(
+    box: Dict[str, float], date_start: str, date_end: str
+) -> List[Any]:
+    # Same order as the $n parameters of the get_profiles_in_region statement;
+    # the end date is made exclusive so the whole last day is included
+    end = datetime.date.fromisoformat(date_end) + datetime.timedelta(days=1)
+    return [
+        box["lon_min"],
+        box["lon_max"],
+        box["lat_min"],
+        box["lat_max"],
+        0,
+        2000,
+        datetime.datetime.fromisoformat(date_start),
+        datetime.datetime.combine(end, datetime.time()),
+    ]
+
+
+def _rows_to_dataframe(rows: List[Any], names: List[str]) -> pd.DataFrame:
+    if not rows:
+        raise FileNotFoundError("No Argo data found for the requested region")
+    df = pd.DataFrame.from_records(rows, columns=names)
+    df = df.rename(columns=TABLE_TO_ARGO_COLUMNS)
+    for column in NUMERIC_ARGO_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    if "TIME" in df.columns:
+        df["TIME"] = pd.to_datetime(df["TIME"], utc=True).dt.tz_localize(None)
+    return df
+
+
+class PostgresSource(ArgoDataSource):
+    """``argo_float_data`` in Postgres, queried through an asyncpg pool.
+
+    The pool lives on the application's event loop; ``fetch_region`` hands the
+    query over to that loop and waits for the rows, so it must not be called
+    from the loop itself. asyncpg keeps the statement prepared per connection
+    after its first use.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: Optional[str] = None, tools_config: Optional[Dict] = None):
+        tools_config = tools_config or load_tools_config()
+        self.statement = tools_config["tools"][REGION_TOOL]["statement"]
+        self.positions_statement = tools_config["tools"][POSITIONS_TOOL]["statement"]
+        self.source_config = tools_config["sources"][POSTGRES_SOURCE]
+        self.dsn = dsn
+        self.queries = 0
+        self._pool = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        import asyncpg
+
+        self._loop = asyncio.get_running_loop()
+        if self.dsn:
+            connect_args = {"dsn": self.dsn}
+        else:
+            connect_args = {
+                "host": self.source_config["host"],
+                "port": self.source_config["port"],
+                "database": self.source_config["database"],
+                "user": self.source_config["user"],
+                "password": self.source_config["password"],
+            }
+        self._pool = await asyncpg.create_pool(
+            min_size=POSTGRES_POOL_MIN, max_size=POSTGRES_POOL_MAX, **connect_args
+        )
+        print(f"Connected Postgres pool ({POSTGRES_POOL_MIN}-{POSTGRES_POOL_MAX})")
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def fetch_rows(self, statement: str, *args) -> List[Any]:
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(statement, *args, timeout=POSTGRES_QUERY_TIMEOUT)
+
+    def fetch_region(
+        self, box: Dict[str, float], date_start: str, date_end: str
+    ) -> pd.DataFrame:
+        if self._pool is None:
+            raise RuntimeError("Postgres source used before start()")
+        future = asyncio.run_coroutine_threadsafe(
+            self.fetch_rows(self.statement, *_region_params(box, date_start, date_end)),
+            self._loop,
+        )
+        rows = future.result()
+        self.queries += 1
+        names = list(rows[0].keys()) if rows else []
+        return _rows_to_dataframe(rows, names)
+
+    def profile_positions(self) -> pd.DataFrame:
+        rows = asyncio.run_coroutine_threadsafe(
+            self.fetch_rows(self.positions_statement), self._loop
+        ).result()
+        names = list(rows[0].keys()) if rows else []
+        return _rows_to_dataframe(rows, names)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "queries": self.queries,
+            "pool_size": self._pool.get_size() if self._pool is not None else 0,
+        }
+
+
+def to_sqlite_statement(statement: str) -> str:
+    """Rewrite a Postgres statement with $n parameters for SQLite (?n)."""
+    return re.sub(r"\$(\d+)", r"?\1", statement)
+
+
+class SqliteSource(ArgoDataSource):
+    """``argo_float_data`` in a local SQLite file, with the tools.yaml statement.
+
+    Timestamps are stored as ISO text, so the date parameters are passed as
+    ISO strings. Each executor thread gets its own connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, tools_config: Optional[Dict] = None):
+        tools_config = tools_config or load_tools_config()
+        self.path = path
+        self.statement = to_sqlite_statement(
+            tools_config["tools"][REGION_TOOL]["statement"]
+        )
+        self.positions_statement = tools_config["tools"][POSITIONS_TOOL]["statement"]
+        self.queries = 0
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def fetch_region(
+        self, box: Dict[str, float], date_start: str, date_end: str
+    ) -> pd.DataFrame:
+        params = [
+            p.isoformat() if isinstance(p, datetime.datetime) else p
+            for p in _region_params(box, date_start, date_end)
+        ]
+        cursor = self._connection().execute(self.statement, params)
+        names = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+        self.queries += 1
+        return _rows_to_dataframe(rows, names)
+
+    def profile_positions(self) -> pd.DataFrame:
+        cursor = self._connection().execute(self.positions_statement)
+        names = [d[0] for d in cursor.description]
+        return _rows_to_dataframe(cursor.fetchall(), names)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "queries": self.queries, "path": self.path}
+
+
+class ProfileIndex:
+    """Profile files of a GDAC index, bucketed on a lat/lon grid.
+
+    The index is held as flat numpy arrays sorted by grid cell, with
+    ``offsets[c]:offsets[c + 1]`` giving the profiles of cell ``c`` (cells are
+    numbered row by row, so a latitude row of a box is one contiguous slice).
+    File paths are split into a categorical directory and a byte-string file
+    name to keep millions of entries compact.
+    """
+
+    def __init__(
+        self,
+        paths: pd.Series,
+        times: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        cell_deg: float = GDAC_INDEX_CELL_DEG,
+    ):
+        self.cell_deg = cell_deg
+        self.n_lat = int(math.ceil(180 / cell_deg))
+        self.n_lon = int(math.ceil(360 / cell_deg))
+
+        cells = self._cell_ids(lat, lon)
+        order = np.lexsort((times, cells))
+        self.lat = lat[order].astype("float32")
+        self.lon = lon[order].astype("float32")
+        self.times = times[order].astype("datetime64[s]")
+        counts = np.bincount(cells, minlength=self.n_lat * self.n_lon)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        paths = paths.iloc[order]
+        dirs = paths.str.rpartition("/")
+        self.dirs = pd.Categorical(dirs[0])
+        self.names = dirs[2].to_numpy(dtype="S")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_index_file(
+        cls, path: str, cell_deg: float = GDAC_INDEX_CELL_DEG
+    ) -> "ProfileIndex":
+        index = read_profile_index(path)
+        return cls(
+            index["file"],
+            index["TIME"].to_numpy(),
+            index["LATITUDE"].to_numpy(),
+            index["LONGITUDE"].to_numpy(),
+            cell_deg,
+        )
+
+    def _cell_ids(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        iy = np.clip(((lat + 90) // self.cell_deg).astype("int64"), 0, self.n_lat - 1)
+        ix = np.clip(((lon + 180) // self.cell_deg).astype("int64"), 0, self.n_lon - 1)
+        return iy * self.n_lon + ix
+
+    def query(
+        self, box: Dict[str, float], time_start: np.datetime64, time_end: np.datetime64
+    ) -> List[str]:
+        """Relative paths of the profiles inside ``box`` and [time_start, time_end)."""
+        corners = self._cell_ids(
+            np.array([box["lat_min"], box["lat_max"]]),
+            np.array([box["lon_min"], box["lon_max"]]),
+        )
+        first_row, first_col = divmod(int(corners[0]), self.n_lon)
+        last_row, last_col = divmod(int(corners[1]), self.n_lon)
+        slices = [
+            np.arange(
+                self.offsets[row * self.n_lon + first_col],
+                self.offsets[row * self.n_lon + last_col + 1],
+            )
+            for row in range(first_row, last_row + 1)
+        ]
+        candidates = np.concatenate(slices) if slices else np.array([], dtype="int64")
+
+        lat = self.lat[candidates]
+        lon = self.lon[candidates]
+        times = self.times[candidates]
+        hits = candidates[
+            (lat >= box["lat_min"])
+            & (lat <= box["lat_max"])
+            & (lon >= box["lon_min"])
+            & (lon <= box["lon_max"])
+            & (times >= time_start)
+            & (times < time_end)
+        ]
+        dirs = self.dirs.categories[self.dirs.codes[hits]]
+        return [f"{d}/{n.decode()}" for d, n in zip(dirs, self.names[hits])]
+
+
+def _char_values(values: np.ndarray, join: bool = False) -> np.ndarray:
+    # Decode a netCDF char array; with ``join`` the last (STRINGn) dimension
+    # is concatenated into one string per entry
+    values = np.ascontiguousarray(values).astype("S1")
+    if join:
+        values = values.view(f"S{values.shape[-1]}")[..., 0]
+    return np.char.strip(np.char.decode(values, "ascii", "replace"))
+
+
+def _masked_values(variable) -> np.ndarray:
+    # Copy a netCDF numeric variable out of the file, with fill values as NaN
+    values = variable.data.astype("float64")
+    fill = getattr(variable, "_FillValue", None)
+    if fill is not None:
+        values[values == float(np.asarray(fill).item())] = np.nan
+    return values
+
+
+def read_profile_file(path: str) -> pd.DataFrame:
+    """Flatten one Argo profile netCDF file into argopy's row layout.
+
+    GDAC profile files are netCDF3, so they are memory-mapped with scipy and
+    only the variables needed here are copied out, which is much cheaper than
+    decoding the whole file with xarray. Adjusted values are used for
+    profiles in adjusted or delayed mode, like argopy's standard user mode.
+    """
+    with netcdf_file(path, "r", mmap=True) as nc:
+        variables = nc.variables
+        n_prof, n_levels = variables["PRES"].shape
+        adjusted = np.isin(_char_values(variables["DATA_MODE"].data), ["A", "D"])
+        juld = _masked_values(variables["JULD"])
+        times = ARGO_REFERENCE_DATE + (juld * 86400).astype("timedelta64[s]")
+        times[np.isnan(juld)] = np.datetime64("NaT")
+        columns = {
+            "PLATFORM_NUMBER": _char_values(variables["PLATFORM_NUMBER"].data, join=True),
+            "CYCLE_NUMBER": variables["CYCLE_NUMBER"].data.astype("int64"),
+            "TIME": times.astype("datetime64[ns]"),
+            "LATITUDE": _masked_values(variables["LATITUDE"]),
+            "LONGITUDE": _masked_values(variables["LONGITUDE"]),
+        }
+        frame = {
+            name: np.repeat(values, n_levels) for name, values in columns.items()
+        }
+        for param in GDAC_PARAMETERS:
+            if param not in variables:
+                continue
+            values = _masked_values(variables[param])
+            qc = _char_values(variables[f"{param}_QC"].data)
+            if f"{param}_ADJUSTED" in variables:
+                values = np.where(
+                    adjusted[:, None], _masked_values(variables[f"{param}_ADJUSTED"]), values
+                )
+                qc = np.where(
+                    adjusted[:, None],
+                    _char_values(variables[f"{param}_ADJUSTED_QC"].data),
+                    qc,
+                )
+            frame[param] = values.reshape(n_prof * n_levels)
+            frame[f"{param}_QC"] = qc.reshape(n_prof * n_levels)
+        # Drop the references into the mapped file so it can be closed
+        del variables
+    df = pd.DataFrame(frame)
+    return df[df["PRES"].notna()]
+
+
+class GdacMirrorSource(ArgoDataSource):
+    """Profile files from a local GDAC mirror.
+
+    The profile index is loaded once into a ``ProfileIndex``; a region query
+    then opens only the files inside the box and date range, in parallel.
+    Reading is local, so results skip the tile cache.
+    """
+
+    name = "gdac"
+
+    def __init__(self, root: str = ARGO_GDAC_PATH):
+        self.root = root
+        self.files_read = 0
+        self._index: Optional[ProfileIndex] = None
+        self._index_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=GDAC_MAX_WORKERS)
+
+    @property
+    def index(self) -> ProfileIndex:
+        with self._index_lock:
+            if self._index is None:
+                started = datetime.datetime.now()
+                self._index = ProfileIndex.from_index_file(
+                    os.path.join(self.root, GDAC_INDEX_FILE)
+                )
+                elapsed = (datetime.datetime.now() - started).total_seconds()
+                print(f"Loaded GDAC index: {len(self._index)} profiles in {elapsed:.1f}s")
+            return self._index
+
+    async def start(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, lambda: self.index)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def profile_positions(self) -> pd.DataFrame:
+        index = self.index
+        return pd.DataFrame(
+            {
+                "LATITUDE": index.lat.astype("float64"),
+                "LONGITUDE": index.lon.astype("float64"),
+                "TIME": index.times.astype("datetime64[ns]"),
+            }
+        )
+
+    def fetch_region(
+        self, box: Dict[str, float], date_start: str, date_end: str
+    ) -> pd.DataFrame:
+        params = _region_params(box, date_start, date_end)
+        files = self.index.query(box, np.datetime64(params[6]), np.datetime64(params[7]))
+        if not files:
+            raise FileNotFoundError("No Argo data found for the requested region")
+
+        paths = [os.path.join(self.root, "dac", f) for f in files]
+        frames = list(self._executor.map(read_profile_file, paths))
+        self.files_read += len(paths)
+        df = pd.concat(frames, ignore_index=True)
+        df = df[
+            df["LATITUDE"].between(box["lat_min"], box["lat_max"])
+            & df["LONGITUDE"].between(box["lon_min"], box["lon_max"])
+            & df["TIME"].between(params[6], params[7], inclusive="left")
+            & df["PRES"].between(params[4], params[5])
+        ]
+        if df.empty:
+            raise FileNotFoundError("No Argo data found for the requested region")
+        return df.reset_index(drop=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "root": self.root,
+            "profiles_indexed": len(self._index) if self._index is not None else 0,
+            "files_read": self.files_read,
+        }
+
+
+def create_data_source(name: Optional[str] = None) -> ArgoDataSource:
+    """Build the data source selected by ``name`` or ARGO_DATA_SOURCE."""
+    name = (name or os.getenv("ARGO_DATA_SOURCE", "argopy")).lower()
+    if name == "argopy":
+        return ArgopySource()
+    if name == "postgres":
+        return PostgresSource(dsn=os.getenv("ARGO_POSTGRES_DSN"))
+    if name == "sqlite":
+        return SqliteSource(os.getenv("ARGO_SQLITE_PATH", "./argo.sqlite3"))
+    if name == "gdac":
+        return GdacMirrorSource()
+    raise ValueError(f"Unknown ARGO_DATA_SOURCE: {name}")
@@ -0,0 +1,279 @@
+"""Offline fast path for region selection on simple queries.
+
+Questions like "salinity in the Bay of Bengal in 2023-05" name one sea from a
+small gazetteer, one or two variables and a plain date phrase. ``RegionQueryParser``
+turns those into the same ``select_region`` args Gemini would return, in well
+under a millisecond. Anything it is not sure about (coordinates, several
+regions, places or parts of a region, seasons, follow-ups that depend on the
+conversation, climatology questions) returns None and is left to Gemini.
+"""
+
+import datetime
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "1") == "1"
+
+# Named basins and seas of the Indian Ocean: (aliases, box)
+REGIONS: Dict[str, Tuple[List[str], Dict[str, float]]] = {
+    "Bay of Bengal": (
+        ["bay of bengal", "bengal bay"],
+        {"lon_min": 80.0, "lon_max": 100.0, "lat_min": 5.0, "lat_max": 23.0},
+    ),
+    "Arabian Sea": (
+        ["arabian sea"],
+        {"lon_min": 50.0, "lon_max": 78.0, "lat_min": 5.0, "lat_max": 25.0},
+    ),
+    "Andaman Sea": (
+        ["andaman sea"],
+        {"lon_min": 92.0, "lon_max": 99.0, "lat_min": 5.0, "lat_max": 17.0},
+    ),
+    "Laccadive Sea": (
+        ["laccadive sea", "lakshadweep sea"],
+        {"lon_min": 71.0, "lon_max": 78.0, "lat_min": 6.0, "lat_max": 14.0},
+    ),
+    "Gulf of Aden": (
+        ["gulf of aden"],
+        {"lon_min": 43.0, "lon_max": 51.5, "lat_min": 10.5, "lat_max": 15.0},
+    ),
+    "Gulf of Oman": (
+        ["gulf of oman", "sea of oman"],
+        {"lon_min": 56.0, "lon_max": 61.5, "lat_min": 22.0, "lat_max": 26.5},
+    ),
+    "Persian Gulf": (
+        ["persian gulf", "arabian gulf"],
+        {"lon_min": 48.0, "lon_max": 56.5, "lat_min": 24.0, "lat_max": 30.5},
+    ),
+    "Red Sea": (
+        ["red sea"],
+        {"lon_min": 32.5, "lon_max": 43.5, "lat_min": 12.5, "lat_max": 30.0},
+    ),
+    "Mozambique Channel": (
+        ["mozambique channel"],
+        {"lon_min": 34.0, "lon_max": 49.0, "lat_min": -26.0, "lat_max": -11.0},
+    ),
+    "Somali Basin": (
+        ["somali basin", "somali sea"],
+        {"lon_min": 41.0, "lon_max": 60.0, "lat_min": -5.0, "lat_max": 12.0},
+    ),
+    "Timor Sea": (
+        ["timor sea"],
+        {"lon_min": 122.0, "lon_max": 133.0, "lat_min": -15.0, "lat_max": -8.5},
+    ),
+    "Great Australian Bight": (
+        ["great australian bight"],
+        {"lon_min": 124.0, "lon_max": 140.0, "lat_min": -40.0, "lat_max": -31.0},
+    ),
+    "Equatorial Indian Ocean": (
+        ["equatorial indian ocean"],
+        {"lon_min": 40.0, "lon_max": 100.0, "lat_min": -5.0, "lat_max": 5.0},
+    ),
+    "Southern Indian Ocean": (
+        ["southern indian ocean", "south indian ocean"],
+        {"lon_min": 20.0, "lon_max": 120.0, "lat_min": -50.0, "lat_max": -10.0},
+    ),
+    "Indian Ocean": (
+        ["indian ocean"],
+        {"lon_min": 20.0, "lon_max": 120.0, "lat_min": -60.0, "lat_max": 30.0},
+    ),
+}
+# Only used when no other region is named ("Bay of Bengal in the Indian Ocean")
+GENERIC_REGIONS = {"Indian Ocean"}
+
+VARIABLE_WORDS = {
+    "temperature": ["temperature", "temperatures", "temp", "sst", "thermal", "warm", "warming"],
+    "salinity": ["salinity", "salinities", "salt", "saline", "psal"],
+    "pressure": ["pressure", "pressures"],
+}
+
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate(
+        [
+            ("january", "jan"), ("february", "feb"), ("march", "mar"),
+            ("april", "apr"), ("may",), ("june", "jun"), ("july", "jul"),
+            ("august", "aug"), ("september", "sep", "sept"),
+            ("october", "oct"), ("november", "nov"), ("december", "dec"),
+        ]
+    )
+    for name in names
+}
+
+# Every other word of a query must come from this list (or name the region,
+# a variable or a date). Anything else, such as a place inside the region, a
+# season, "average" or a follow-up like "there", is left to Gemini.
+QUERY_WORDS = {
+    "show", "me", "give", "get", "find", "display", "plot", "fetch", "list",
+    "what", "s", "is", "are", "was", "were", "how", "i", "want", "to", "see",
+    "can", "could", "you", "please", "tell", "about", "and", "both", "with",
+    "the", "a", "an", "of", "in", "for", "during", "from", "until", "till",
+    "through", "thru", "data", "argo", "float", "floats", "profile",
+    "profiles", "measurement", "measurements", "value", "values", "reading",
+    "readings", "observation", "observations", "level", "levels", "water",
+    "between",
+}
+
+_DATE_PATTERN = re.compile(
+    r"\b(?P<ym>(?P<ym_y>(?:19|20)\d{2})-(?P<ym_m>\d{1,2}))\b"
+    r"|\b(?P<mon>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+    r"(?:\s*,?\s*(?P<mon_y>(?:19|20)\d{2})\b)?\b"
+    r"|\b(?P<year>(?:19|20)\d{2})\b"
+    r"|\b(?P<rel>last year|this year|last month|this month)\b"
+)
+# What may separate the two ends of a date range
+_RANGE_JOIN = re.compile(r"^\s*(?:to|until|till|through|thru|-|–|and)\s*$")
+_FIRST_ARGO_YEAR = 1999
+
+
+def _month_add(year: int, month: int, delta: int) -> Tuple[int, int]:
+    index = year * 12 + month - 1 + delta
+    return index // 12, index % 12 + 1
+
+
+class RegionQueryParser:
+    """Resolve simple queries to ``select_region`` args without Gemini."""
+
+    def __init__(self, enabled: bool = GAZETTEER_ENABLED):
+        self.enabled = enabled
+        self.hits = 0
+        self.fallbacks = 0
+        self._aliases = sorted(
+            (
+                (alias, name)
+                for name, (aliases, _) in REGIONS.items()
+                for alias in aliases
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def _region(self, text: str) -> Tuple[Optional[str], str]:
+        """The one region named in ``text``, and the text with it removed."""
+        found = []
+        for alias, name in self._aliases:
+            pattern = r"\b(?:the\s+)?" + re.escape(alias) + r"\b"
+            if re.search(pattern, text):
+                found.append(name)
+                text = re.sub(pattern, " ", text)
+        names = set(found)
+        if len(names) > 1:
+            names -= GENERIC_REGIONS
+        if len(names) != 1:
+            return None, text
+        return names.pop(), text
+
+    @staticmethod
+    def _variables(words: List[str]) -> List[str]:
+        variables = []
+        for word in words:
+            for variable, synonyms in VARIABLE_WORDS.items():
+                if word in synonyms and variable not in variables:
+                    variables.append(variable)
+        return variables
+
+    @staticmethod
+    def _dates(
+        text: str, today: datetime.date
+    ) -> Optional[Tuple[Optional[str], Optional[str], str]]:
+        """Month range named in ``text`` as (date_min, date_max, remaining text).
+
+        Returns (None, None, text) when no date is mentioned and None when the
+        date phrase isn't understood.
+        """
+        spans = []  # (start (y, m), end (y, m) or None for a bare month, match)
+        for match in _DATE_PATTERN.finditer(text):
+            if match.group("ym"):
+                ym = (int(match.group("ym_y")), int(match.group("ym_m")))
+                spans.append((ym, ym, match))
+            elif match.group("mon"):
+                month = MONTHS[match.group("mon")]
+                if match.group("mon_y"):
+                    ym = (int(match.group("mon_y")), month)
+                    spans.append((ym, ym, match))
+                else:
+                    spans.append(((None, month), None, match))
+            elif match.group("year"):
+                year = int(match.group("year"))
+                spans.append(((year, 1), (year, 12), match))
+            else:
+                rel = match.group("rel")
+                if rel == "last year":
+                    spans.append(((today.year - 1, 1), (today.year - 1, 12), match))
+                elif rel == "this year":
+                    spans.append(((today.year, 1), (today.year, today.month), match))
+                elif rel == "last month":
+                    ym = _month_add(today.year, today.month, -1)
+                    spans.append((ym, ym, match))
+                else:
+                    spans.append(((today.year, today.month), (today.year, today.month), match))
+
+        if not spans:
+            return None, None, text
+        if len(spans) == 1:
+            start, end, _ = spans[0]
+        elif len(spans) == 2 and _RANGE_JOIN.match(
+            text[spans[0][2].end() : spans[1][2].start()]
+        ):
+            start, end = spans[0][0], spans[1][1]
+            # "March to June 2022": the first month takes the year of the second
+            if start[0] is None and end is not None:
+                start = (end[0], start[1])
+        else:
+            return None
+        if start[0] is None or end is None:
+            return None
+
+        if not all(1 <= m <= 12 for _, m in (start, end)):
+            return None
+        if start[0] < _FIRST_ARGO_YEAR or not start <= end <= (today.year, today.month):
+            return None
+        for *_, match in spans:
+            text = text.replace(match.group(0), " ", 1)
+        return f"{start[0]}-{start[1]:02d}", f"{end[0]}-{end[1]:02d}", text
+
+    def parse(
+        self, query: str, today: Optional[datetime.date] = None
+    ) -> Optional[Dict[str, Any]]:
+        """``select_region`` args for ``query``, or None to ask Gemini."""
+        if not self.enabled:
+            return None
+        args = self._parse(query.lower(), today or datetime.date.today())
+        if args is None:
+            self.fallbacks += 1
+        else:
+            self.hits += 1
+        return args
+
+    def _parse(self, text: str, today: datetime.date) -> Optional[Dict[str, Any]]:
+        name, text = self._region(text)
+        if name is None:
+            return None
+        dates = self._dates(text, today)
+        if dates is None:
+            return None
+        date_min, date_max, text = dates
+        # Coordinates, depths or anything else numeric is left to Gemini too
+        words = re.findall(r"[a-z]+|\d+", text)
+        variables = self._variables(words)
+        synonyms = {word for names in VARIABLE_WORDS.values() for word in names}
+        if not variables or not set(words) <= QUERY_WORDS | synonyms:
+            return None
+
+        args: Dict[str, Any] = {
+            "mode": "box",
+            "box": dict(REGIONS[name][1]),
+            "variables": variables,
+        }
+        if date_min:
+            args["date_min"], args["date_max"] = date_min, date_max
+        return args
+
+    def stats(self) -> Dict[str, Any]:
+        parsed = self.hits + self.fallbacks
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(self.hits / parsed, 3) if parsed else None,
+        }
@@ -0,0 +1,468 @@
+"""Bulk-load Argo profiles into the local ``argo_float_data`` table.
+
+Profiles are read from argopy or a GDAC mirror (see datastore.py) one month
+and one sub-box at a time on a worker pool, and written to Postgres (COPY into
+a staging table, then an upsert) or SQLite (batched upserts). Rows are keyed
+on (platform_number, cycle_number, pres), so re-running a range is harmless.
+
+Runs are incremental: without --start, loading resumes a little before the
+newest profile already stored, and a per-platform watermark skips cycles that
+are already loaded.
+
+    python -m backend.ingest --target sqlite --start 2024-01-01 --end 2024-06-30 \
+        --box 60 100 -10 25
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .datastore import (
+    POSTGRES_SOURCE,
+    TABLE_TO_ARGO_COLUMNS,
+    create_data_source,
+    load_tools_config,
+)
+
+INGEST_WORKERS = int(os.getenv("ARGO_INGEST_WORKERS", "4"))
+INGEST_REGION_DEG = float(os.getenv("ARGO_INGEST_REGION_DEG", "10"))
+INGEST_BATCH_ROWS = int(os.getenv("ARGO_INGEST_BATCH_ROWS", "50000"))
+# Incremental runs restart this many days before the newest stored profile,
+# since profiles reach the servers some time after they are measured
+INGEST_LOOKBACK_DAYS = int(os.getenv("ARGO_INGEST_LOOKBACK_DAYS", "30"))
+
+TABLE_COLUMNS = [
+    "platform_number",
+    "cycle_number",
+    "reference_date_time",
+    "latitude",
+    "longitude",
+    "pres",
+    "temp",
+    "psal",
+    "pres_qc",
+    "temp_qc",
+    "psal_qc",
+    "temp_adjusted",
+    "psal_adjusted",
+    "temp_adjusted_qc",
+    "psal_adjusted_qc",
+    "project_name",
+    "pi_name",
+    "platform_type",
+]
+KEY_COLUMNS = ["platform_number", "cycle_number", "pres"]
+QC_COLUMNS = [c for c in TABLE_COLUMNS if c.endswith("_qc")]
+ARGO_TO_TABLE_COLUMNS = {
+    **{argo: table for table, argo in TABLE_TO_ARGO_COLUMNS.items()},
+    "TEMP_ADJUSTED": "temp_adjusted",
+    "PSAL_ADJUSTED": "psal_adjusted",
+    "TEMP_ADJUSTED_QC": "temp_adjusted_qc",
+    "PSAL_ADJUSTED_QC": "psal_adjusted_qc",
+    # Float metadata read by the tools.yaml statements; argopy's standard
+    # mode doesn't return it, so it is usually left NULL
+    "PROJECT_NAME": "project_name",
+    "PI_NAME": "pi_name",
+    "PLATFORM_TYPE": "platform_type",
+}
+
+# {timestamp} is the only type that differs between the two databases
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS argo_float_data (
+        platform_number TEXT NOT NULL,
+        cycle_number INTEGER NOT NULL,
+        reference_date_time {timestamp},
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        pres DOUBLE PRECISION NOT NULL,
+        temp DOUBLE PRECISION,
+        psal DOUBLE PRECISION,
+        pres_qc TEXT,
+        temp_qc TEXT,
+        psal_qc TEXT,
+        temp_adjusted DOUBLE PRECISION,
+        psal_adjusted DOUBLE PRECISION,
+        temp_adjusted_qc TEXT,
+        psal_adjusted_qc TEXT,
+        project_name TEXT,
+        pi_name TEXT,
+        platform_type TEXT,
+        PRIMARY KEY (platform_number, cycle_number, pres)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS argo_float_data_time_idx "
+    "ON argo_float_data (reference_date_time)",
+    "CREATE INDEX IF NOT EXISTS argo_float_data_location_idx "
+    "ON argo_float_data (latitude, longitude)",
+    """
+    CREATE TABLE IF NOT EXISTS argo_ingest_watermark (
+        platform_number TEXT PRIMARY KEY,
+        last_cycle INTEGER NOT NULL,
+        updated_at {timestamp}
+    )
+    """,
+]
+
+
+def _upsert_statement(source_table: Optional[str] = None) -> str:
+    # INSERT ... ON CONFLICT DO UPDATE, valid in both Postgres and SQLite
+    columns = ", ".join(TABLE_COLUMNS)
+    updates = ", ".join(
+        f"{c} = excluded.{c}" for c in TABLE_COLUMNS if c not in KEY_COLUMNS
+    )
+    if source_table:
+        values = f"SELECT {columns} FROM {source_table}"
+    else:
+        values = "VALUES (" + ", ".join("?" for _ in TABLE_COLUMNS) + ")"
+    return (
+        f"INSERT INTO argo_float_data ({columns}) {values} "
+        f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET {updates}"
+    )
+
+
+# Formatted with the parameter style and the two-argument max of each database
+WATERMARK_UPSERT = (
+    "INSERT INTO argo_ingest_watermark (platform_number, last_cycle, updated_at) "
+    "VALUES ({p1}, {p2}, {p3}) ON CONFLICT (platform_number) DO UPDATE SET "
+    "last_cycle = {greatest}(argo_ingest_watermark.last_cycle, excluded.last_cycle), "
+    "updated_at = excluded.updated_at"
+)
+
+
+def to_table_rows(ds: pd.DataFrame) -> pd.DataFrame:
+    """Convert an argopy-layout DataFrame into argo_float_data columns."""
+    df = ds.rename(columns=ARGO_TO_TABLE_COLUMNS)
+    df = df[[c for c in TABLE_COLUMNS if c in df.columns]].copy()
+    for column in TABLE_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    df = df[TABLE_COLUMNS]
+    df = df[df["pres"].notna() & df["platform_number"].notna()]
+
+    df["platform_number"] = df["platform_number"].astype(str).str.strip()
+    df["cycle_number"] = df["cycle_number"].astype("int64")
+    df["reference_date_time"] = pd.to_datetime(df["reference_date_time"])
+    for column in QC_COLUMNS:
+        # argopy returns QC flags as numbers, the table stores them as text
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values):
+            values = values.astype("Int64").astype(str).where(values.notna(), None)
+        df[column] = values
+    return df.drop_duplicates(KEY_COLUMNS, keep="last")
+
+
+def _records(df: pd.DataFrame, timestamps_as_text: bool) -> List[Tuple]:
+    df = df.astype(object).where(df.notna(), None)
+    if timestamps_as_text:
+        df["reference_date_time"] = [
+            t.isoformat() if t is not None else None for t in df["reference_date_time"]
+        ]
+    else:
+        df["reference_date_time"] = [
+            t.to_pydatetime() if t is not None else None
+            for t in df["reference_date_time"]
+        ]
+    return list(df.itertuples(index=False, name=None))
+
+
+class SqliteWriter:
+    """Writes to a SQLite file with batched upserts in one transaction."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    async def ensure_schema(self) -> None:
+        for statement in SCHEMA_STATEMENTS:
+            self.conn.execute(statement.format(timestamp="TEXT"))
+        self.conn.commit()
+
+    async def watermarks(self) -> Dict[str, int]:
+        rows = self.conn.execute(
+            "SELECT platform_number, last_cycle FROM argo_ingest_watermark"
+        ).fetchall()
+        return dict(rows)
+
+    async def latest_time(self) -> Optional[datetime.datetime]:
+        (latest,) = self.conn.execute(
+            "SELECT MAX(reference_date_time) FROM argo_float_data"
+        ).fetchone()
+        return datetime.datetime.fromisoformat(latest) if latest else None
+
+    async def write(self, df: pd.DataFrame, cycles: Dict[str, int]) -> int:
+        now = datetime.datetime.now().isoformat()
+        with self.conn:
+            for start in range(0, len(df), INGEST_BATCH_ROWS):
+                self.conn.executemany(
+                    _upsert_statement(),
+                    _records(df.iloc[start : start + INGEST_BATCH_ROWS], True),
+                )
+            self.conn.executemany(
+                WATERMARK_UPSERT.format(p1="?", p2="?", p3="?", greatest="MAX"),
+                [(p, c, now) for p, c in cycles.items()],
+            )
+        return len(df)
+
+    async def close(self) -> None:
+        self.conn.close()
+
+
+class PostgresWriter:
+    """Writes to Postgres: COPY into a temporary table, then one upsert."""
+
+    def __init__(self, dsn: Optional[str] = None):
+        self.dsn = dsn
+        self.source_config = load_tools_config()["sources"][POSTGRES_SOURCE]
+        self.conn = None
+
+    async def connect(self) -> None:
+        import asyncpg
+
+        if self.dsn:
+            self.conn = await asyncpg.connect(dsn=self.dsn)
+        else:
+            self.conn = await asyncpg.connect(
+                host=self.source_config["host"],
+                port=self.source_config["port"],
+                database=self.source_config["database"],
+                user=self.source_config["user"],
+                password=self.source_config["password"],
+            )
+
+    async def ensure_schema(self) -> None:
+        if self.conn is None:
+            await self.connect()
+        for statement in SCHEMA_STATEMENTS:
+            await self.conn.execute(statement.format(timestamp="TIMESTAMP"))
+
+    async def watermarks(self) -> Dict[str, int]:
+        rows = await self.conn.fetch(
+            "SELECT platform_number, last_cycle FROM argo_ingest_watermark"
+        )
+        return {r["platform_number"]: r["last_cycle"] for r in rows}
+
+    async def latest_time(self) -> Optional[datetime.datetime]:
+        return await self.conn.fetchval(
+            "SELECT MAX(reference_date_time) FROM argo_float_data"
+        )
+
+    async def write(self, df: pd.DataFrame, cycles: Dict[str, int]) -> int:
+        now = datetime.datetime.now()
+        async with self.conn.transaction():
+            if not df.empty:
+                await self.conn.execute(
+                    "CREATE TEMPORARY TABLE IF NOT EXISTS argo_float_data_staging "
+                    "(LIKE argo_float_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                )
+                await self.conn.copy_records_to_table(
+                    "argo_float_data_staging",
+                    records=_records(df, False),
+                    columns=TABLE_COLUMNS,
+                )
+                await self.conn.execute(_upsert_statement("argo_float_data_staging"))
+            await self.conn.executemany(
+                WATERMARK_UPSERT.format(p1="$1", p2="$2", p3="$3", greatest="GREATEST"),
+                [(p, c, now) for p, c in cycles.items()],
+            )
+        return len(df)
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.conn.close()
+
+
+def month_ranges(start: datetime.date, end: datetime.date) -> List[Tuple[str, str]]:
+    # Inclusive [first day, last day] pairs covering start..end
+    ranges = []
+    current = start
+    while current <= end:
+        next_month = (current.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        last = min(next_month - datetime.timedelta(days=1), end)
+        ranges.append((current.isoformat(), last.isoformat()))
+        current = next_month
+    return ranges
+
+
+def sub_boxes(box: Dict[str, float], step: float) -> List[Dict[str, float]]:
+    boxes = []
+    lat = box["lat_min"]
+    while lat < box["lat_max"]:
+        lon = box["lon_min"]
+        while lon < box["lon_max"]:
+            boxes.append(
+                {
+                    "lon_min": lon,
+                    "lon_max": min(lon + step, box["lon_max"]),
+                    "lat_min": lat,
+                    "lat_max": min(lat + step, box["lat_max"]),
+                }
+            )
+            lon += step
+        lat += step
+    return boxes
+
+
+def _fetch_rows(source, box: Dict[str, float], start: str, end: str) -> pd.DataFrame:
+    try:
+        return to_table_rows(source.fetch_region(box, start, end))
+    except FileNotFoundError:
+        return pd.DataFrame(columns=TABLE_COLUMNS)
+
+
+def _new_cycles(
+    df: pd.DataFrame, watermarks: Dict[str, int]
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    # Keep only cycles past each platform's watermark; return the new marks
+    last = df["platform_number"].map(watermarks).fillna(-1)
+    df = df[df["cycle_number"] > last]
+    cycles = df.groupby("platform_number")["cycle_number"].max()
+    return df, {p: int(c) for p, c in cycles.items()}
+
+
+async def ingest(
+    writer,
+    source_name: str,
+    box: Dict[str, float],
+    start: Optional[datetime.date],
+    end: datetime.date,
+    workers: int = INGEST_WORKERS,
+    region_deg: float = INGEST_REGION_DEG,
+    full: bool = False,
+) -> Dict[str, Any]:
+    await writer.ensure_schema()
+    if start is None:
+        latest = await writer.latest_time()
+        if latest is None:
+            raise ValueError("The table is empty; pass --start for the first load")
+        # Restart from the top of the newest stored month: a run stopped
+        # part way through a month has only written some of its sub-boxes
+        start = latest.date().replace(day=1) - datetime.timedelta(
+            days=INGEST_LOOKBACK_DAYS
+        )
+    watermarks = {} if full else await writer.watermarks()
+
+    source = create_data_source(source_name)
+    await source.start()
+    boxes = sub_boxes(box, region_deg)
+    tasks = [
+        (sub_box, month_start, month_end)
+        for month_start, month_end in month_ranges(start, end)
+        for sub_box in boxes
+    ]
+    print(f"Ingesting {len(tasks)} month/region chunks from {source_name} ({start} to {end})")
+
+    loop = asyncio.get_running_loop()
+    started = time.time()
+    fetched = written = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Fetches run ahead concurrently, but chunks are written in
+            # month order, and each month's cycle watermarks are held back
+            # until its last sub-box is written: an interrupted run never
+            # marks a cycle done that a missing sub-box still holds
+            month_cycles: Dict[str, int] = {}
+            pending = collections.deque()
+            queued = iter(tasks)
+            for task in itertools.islice(queued, workers * 2):
+                pending.append(loop.run_in_executor(executor, _fetch_rows, source, *task))
+            done = 0
+            while pending:
+                df = await pending.popleft()
+                for task in itertools.islice(queued, 1):
+                    pending.append(
+                        loop.run_in_executor(executor, _fetch_rows, source, *task)
+                    )
+                done += 1
+                fetched += len(df)
+                # Filtering uses the watermarks from the start of the run;
+                # a platform's later months must not hide its earlier ones
+                df, cycles = _new_cycles(df, watermarks)
+                for platform, cycle in cycles.items():
+                    month_cycles[platform] = max(cycle, month_cycles.get(platform, cycle))
+                if done % len(boxes) == 0:
+                    written += await writer.write(df, month_cycles)
+                    month_cycles = {}
+                elif not df.empty:
+                    written += await writer.write(df, {})
+                elapsed = time.time() - started
+                print(
+                    f"[{done}/{len(tasks)}] {written} rows written "
+                    f"({written / elapsed:.0f} rows/s, {fetched} fetched)"
+                )
+    finally:
+        await source.close()
+
+    elapsed = time.time() - started
+    return {
+        "chunks": len(tasks),
+        "rows_fetched": fetched,
+        "rows_written": written,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(written / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", choices=["postgres", "sqlite"], default="postgres")
+    parser.add_argument("--dsn", default=os.getenv("ARGO_POSTGRES_DSN"))
+    parser.add_argument(
+        "--sqlite-path", default=os.getenv("ARGO_SQLITE_PATH", "./argo.sqlite3")
+    )
+    parser.add_argument("--source", choices=["argopy", "gdac"], default="argopy")
+    parser.add_argument(
+        "--box",
+        nargs=4,
+        type=float,
+        metavar=("LON_MIN", "LON_MAX", "LAT_MIN", "LAT_MAX"),
+        default=[-180, 180, -90, 90],
+    )
+    parser.add_argument("--start", type=datetime.date.fromisoformat)
+    parser.add_argument(
+        "--end", type=datetime.date.fromisoformat, default=datetime.date.today()
+    )
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--region-deg", type=float, default=INGEST_REGION_DEG)
+    parser.add_argument(
+        "--full", action="store_true", help="ignore watermarks and upsert every cycle"
+    )
+    args = parser.parse_args(argv)
+
+    box = dict(zip(["lon_min", "lon_max", "lat_min", "lat_max"], args.box))
+    if args.target == "sqlite":
+        writer = SqliteWriter(args.sqlite_path)
+    else:
+        writer = PostgresWriter(args.dsn)
+
+    async def run():
+        try:
+            return await ingest(
+                writer,
+                args.source,
+                box,
+                args.start,
+                args.end,
+                workers=args.workers,
+                region_deg=args.region_deg,
+                full=args.full,
+            )
+        finally:
+            await writer.close()
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
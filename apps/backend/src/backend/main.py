@@ -1,8 +1,13 @@
 import os
 import json
 import asyncio
+import threading
+import time
 import traceback
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 from fsspec.exceptions import FSTimeoutError
 import aiohttp
 from dotenv import load_dotenv
@@ -16,20 +21,113 @@ from fastapi.middleware.cors import CORSMiddleware
 from google import genai
 from google.genai import types
 
-# Argopy import (used to fetch Argo profiles)
-# Make sure argopy is installed in the environment where this runs.
-from argopy import DataFetcher as ArgoDataFetcher
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
 import calendar
 import datetime
 import math
-import math
+import re
 import chromadb
 from chromadb.utils import embedding_functions
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from uuid import uuid4
+
+from .climatology import ClimatologyCube, STANDARD_PRESSURE_BINS, pressure_bin_index
+from .coverage import CoverageIndex
+from .gazetteer import MONTHS, RegionQueryParser
+from .datastore import create_data_source
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Shared Gemini client: concurrent calls allowed and per-call timeout
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+# Reuse the select_region args of an earlier query at most this embedding
+# distance away (asked after the same previous query) instead of calling Gemini
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.05"))
+# Per-stage timeouts of the query pipeline (see StageGraph), overridable with
+# STAGE_TIMEOUT_<STAGE>_SECONDS
+STAGE_TIMEOUTS = {
+    name: float(os.getenv(f"STAGE_TIMEOUT_{name.upper()}_SECONDS", default))
+    for name, default in {
+        "similar_chats": "5",
+        "region_cache": "5",
+        "select_region": "90",
+        "fetch": "600",
+        "analysis": "120",
+        "graph_analysis": "10",
+        "respond": "60",
+        "store": "30",
+    }.items()
+}
+
+# On-disk cache of Argo region fetches (see ArgoRegionCache)
+ARGO_CACHE_DIR = os.getenv("ARGO_CACHE_DIR", "./argo_cache")
+ARGO_CACHE_MAX_BYTES = int(os.getenv("ARGO_CACHE_MAX_MB", "512")) * 1024 * 1024
+ARGO_CACHE_RECENT_MONTHS = int(os.getenv("ARGO_CACHE_RECENT_MONTHS", "3"))
+ARGO_CACHE_RECENT_TTL = int(os.getenv("ARGO_CACHE_RECENT_TTL_SECONDS", "21600"))
+# Regions are fetched and cached as ARGO_TILE_DEG x ARGO_TILE_DEG x 1 month tiles
+ARGO_TILE_DEG = float(os.getenv("ARGO_TILE_DEG", "1.0"))
+ARGO_MAX_TILES = int(os.getenv("ARGO_MAX_TILES", "2000"))
+# Points mode: each point covers +/- ARGO_POINT_RADIUS_DEG; points within
+# ARGO_POINT_GROUP_DEG of each other share one region fetch
+ARGO_POINT_RADIUS_DEG = 0.1
+ARGO_POINT_GROUP_DEG = float(os.getenv("ARGO_POINT_GROUP_DEG", "2.0"))
+ARGO_POINTS_MAX_WORKERS = int(os.getenv("ARGO_POINTS_MAX_WORKERS", "4"))
+# Columns kept for each variable Gemini can select; coordinates are always kept
+COORDINATE_COLUMNS = ["LATITUDE", "LONGITUDE", "TIME"]
+VARIABLE_COLUMNS = {
+    "temperature": ["TEMP"],
+    "salinity": ["PSAL"],
+    "pressure": ["PRES"],
+}
+# Profiles returned per region, sampled over a lat/lon/time grid
+ARGO_SAMPLE_SIZE = int(os.getenv("ARGO_SAMPLE_SIZE", "50"))
+ARGO_SAMPLE_SEED = int(os.getenv("ARGO_SAMPLE_SEED", "0"))
+ARGO_SAMPLE_TIME_BINS = int(os.getenv("ARGO_SAMPLE_TIME_BINS", "4"))
+# Depth statistics (on STANDARD_PRESSURE_BINS) and their grid cell size
+DEPTH_STAT_VARIABLES = ["TEMP", "PSAL"]
+DEPTH_STATS_CELL_DEG = float(os.getenv("DEPTH_STATS_CELL_DEG", "1.0"))
+# Box requests whose raw rows would take more than ARGO_FETCH_MAX_MB are fetched
+# in month/sub-box chunks; at most ARGO_FETCH_RESERVOIR candidate profiles are
+# kept between chunks for the final sample
+ARGO_FETCH_MAX_BYTES = int(os.getenv("ARGO_FETCH_MAX_MB", "256")) * 1024 * 1024
+ARGO_FETCH_RESERVOIR = int(os.getenv("ARGO_FETCH_RESERVOIR", "5000"))
+# Size estimate: tiles are downloaded with every column, about this many bytes
+# per level in pandas; profiles per tile-month is used without a coverage index
+ARGO_BYTES_PER_ROW = 160
+ARGO_LEVELS_PER_PROFILE = 100
+ARGO_PROFILES_PER_TILE_MONTH = 0.5
+# Start the broadened (+/- ARGO_BROADER_BOX_DEG) box fetch if the original box
+# hasn't returned after this many seconds
+ARGO_HEDGE_DELAY = float(os.getenv("ARGO_HEDGE_DELAY_SECONDS", "10"))
+ARGO_BROADER_BOX_DEG = 2.0
+# Fetch the likely region (previous turn or most similar chat) while Gemini
+# is still selecting it
+ARGO_SPECULATE_ENABLED = os.getenv("ARGO_SPECULATE_ENABLED", "1") == "1"
+# Plan box fetches with an in-memory index of where profiles exist. Off by
+# default for the argopy source, whose index is the global GDAC file list
+ARGO_COVERAGE_ENABLED = os.getenv(
+    "ARGO_COVERAGE_ENABLED",
+    "0" if os.getenv("ARGO_DATA_SOURCE", "argopy").lower() == "argopy" else "1",
+) == "1"
+# How often the coverage index is rebuilt from the data source's profile positions
+ARGO_COVERAGE_REFRESH = int(os.getenv("ARGO_COVERAGE_REFRESH_SECONDS", "86400"))
+# Background prefetch of the most requested regions into the Argo cache
+ARGO_PREFETCH_ENABLED = os.getenv("ARGO_PREFETCH_ENABLED", "1") == "1"
+ARGO_PREFETCH_INTERVAL = int(os.getenv("ARGO_PREFETCH_INTERVAL_SECONDS", "3600"))
+ARGO_PREFETCH_TOP_N = int(os.getenv("ARGO_PREFETCH_TOP_N", "5"))
+ARGO_PREFETCH_CONCURRENCY = int(os.getenv("ARGO_PREFETCH_CONCURRENCY", "2"))
+ARGO_PREFETCH_BUDGET = int(os.getenv("ARGO_PREFETCH_BUDGET_SECONDS", "600"))
+# Popularity is counted over this many of the newest chats
+ARGO_PREFETCH_HISTORY = int(os.getenv("ARGO_PREFETCH_HISTORY", "500"))
+# Always warmed, with the default date range, until the history says otherwise
+DEFAULT_PREFETCH_REGIONS = [
+    {"lon_min": 80.0, "lon_max": 100.0, "lat_min": 5.0, "lat_max": 23.0},  # Bay of Bengal
+    {"lon_min": 50.0, "lon_max": 78.0, "lat_min": 5.0, "lat_max": 25.0},  # Arabian Sea
+]
 
 app = FastAPI()
 
@@ -63,6 +161,10 @@ sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFuncti
 chat_embeddings_collection = chroma_client.get_or_create_collection(
     name="ChatEmbeddings", embedding_function=sentence_transformer_ef
 )
+# Query texts and the select_region args Gemini chose for them
+region_selections_collection = chroma_client.get_or_create_collection(
+    name="RegionSelections", embedding_function=sentence_transformer_ef
+)
 
 select_region_function = {
     "name": "select_region",
@@ -121,6 +223,14 @@ select_region_function = {
                 "type": "string",
                 "description": "End date in YYYY-MM format (optional).",
             },
+            "aggregate": {
+                "type": "boolean",
+                "description": (
+                    "True when the user wants a typical or average value for a region and "
+                    "month(s) (a climatology, e.g. 'average temperature in the Arabian Sea in March') "
+                    "rather than individual profiles or a specific year."
+                ),
+            },
         },
         "required": ["mode"],
     },
@@ -171,6 +281,118 @@ def search_similar_chats(
         return []
 
 
+class SemanticRegionCache:
+    """Skip the region-selection Gemini call for near-duplicate queries.
+
+    Every select_region call Gemini makes is stored with the query text as the
+    document. A later query whose embedding is within ``max_distance`` of a
+    stored one reuses its args, provided it follows the same previous query in
+    its conversation: follow-ups like "and in 2022?" mean different regions
+    after different questions. Embeddings barely tell "2022" from "2023", so
+    the numbers, months, relative dates, seasons and directions of both
+    queries must also match exactly.
+    """
+
+    _LITERAL = re.compile(
+        r"-?\d+(?:\.\d+)?(?:\s*°)?(?:\s*[nsew]\b)?"
+        r"|\b(?:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b"
+        r"|\b(?:last|this|next|previous|past|recent|latest|current|today|yesterday"
+        r"|years?|months?|weeks?|days?|decades?|winter|spring|summer|autumn|fall"
+        r"|monsoon|north|south|east|west)\b"
+    )
+
+    def __init__(
+        self,
+        collection,
+        max_distance: float = SEMANTIC_CACHE_MAX_DISTANCE,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.collection = collection
+        self.max_distance = max_distance
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def context_key(conversation_history: List[str]) -> str:
+        if not conversation_history or len(conversation_history) < 2:
+            return ""
+        return " ".join(str(conversation_history[-2]).lower().split())
+
+    @classmethod
+    def literal_key(cls, query: str) -> str:
+        """The numbers, months and date/direction words of ``query``, in order."""
+        literals = []
+        for match in cls._LITERAL.finditer(query.lower()):
+            token = re.sub(r"[\s°]", "", match.group(0))
+            literals.append(str(MONTHS.get(token, token)))
+        return " ".join(literals)
+
+    def lookup(
+        self, query: str, conversation_history: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """The stored select_region function call for ``query``, if any."""
+        if not self.enabled:
+            return None
+        try:
+            results = self.collection.query(
+                query_texts=[query],
+                n_results=1,
+                where={
+                    "$and": [
+                        {"context": self.context_key(conversation_history)},
+                        {"literals": self.literal_key(query)},
+                    ]
+                },
+                include=["metadatas", "distances"],
+            )
+            if results["distances"] and results["distances"][0]:
+                distance = results["distances"][0][0]
+                if distance <= self.max_distance:
+                    args = json.loads(results["metadatas"][0][0]["args"])
+                    self.hits += 1
+                    print(f"Semantic cache hit (distance {distance:.3f})")
+                    return {"name": "select_region", "args": args}
+        except Exception as e:
+            print(f"Error searching region selections: {e}")
+        self.misses += 1
+        return None
+
+    def store(
+        self, query: str, conversation_history: List[str], args: Dict[str, Any]
+    ) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.collection.add(
+                ids=[str(uuid4())],
+                documents=[query],
+                metadatas=[
+                    {
+                        "context": self.context_key(conversation_history),
+                        "literals": self.literal_key(query),
+                        "args": json.dumps(args),
+                        "timestamp": datetime.datetime.utcnow().isoformat(),
+                    }
+                ],
+            )
+        except Exception as e:
+            print(f"Failed to store region selection: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+semantic_region_cache = SemanticRegionCache(region_selections_collection)
+
+
 # --- Helper: prepare Google client ---
 def normalize_date_range(date_min: Optional[str], date_max: Optional[str]):
     """
@@ -208,93 +430,109 @@ def create_genai_client() -> genai.Client:
     api_key = GOOGLE_API_KEY
     if not api_key:
         raise RuntimeError("Environment variable GOOGLE_API_KEY is required")
-    client = genai.Client(api_key=api_key)
+    client = genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(timeout=int(GEMINI_TIMEOUT * 1000)),
+    )
     # Note: some genai SDKs accept api_key as Client(api_key=...), adapt if needed.
     return client
 
 
-# --- Helper: generate dynamic analysis using Gemini ---
-def generate_data_analysis(
-    query: str, data_result: Dict[str, Any], query_meta: Dict[str, Any]
-) -> str:
-    """Generate a dynamic analysis of the ocean data based on the user's query and results."""
-    client = create_genai_client()
-
-    # Prepare data summary for Gemini
-    data_summary = ""
-    if data_result.get("summary"):
-        summary_data = data_result["summary"]
-        if isinstance(summary_data, list) and len(summary_data) > 0:
-            data_summary = f"Found {len(summary_data)} data points with columns: {list(summary_data[0].keys()) if summary_data[0] else 'none'}"
-        else:
-            data_summary = f"Found data with summary: {str(summary_data)[:200]}..."
-    elif data_result.get("summaries"):
-        summaries = data_result["summaries"]
-        successful = [s for s in summaries if not s.get("error")]
-        data_summary = f"Found data from {len(successful)} out of {len(summaries)} requested locations"
-
-    # Create analysis prompt
-    analysis_prompt = f"""
-You are an ocean data analyst. A user asked: "{query}"
-
-Query details:
-- Mode: {query_meta.get("mode", "unknown")}
-- Time period: {query_meta.get("date_start", "N/A")} to {query_meta.get("date_end", "N/A")}
-- Variables requested: {query_meta.get("selected_variables", [])}
-
-Data results:
-{data_summary}
-
-RESPONSE STYLE GUIDELINES:
-
-**IMPORTANT**: Always use rich Markdown formatting to make your response visually appealing and easy to read. Use **bold text**, bullet points, headers, and separators.
+class GeminiService:
+    """One application-wide async Gemini client.
 
-1. **RESEARCH/ANALYSIS QUERIES** (when user asks "why", "how", "what does this mean", "explain", "analyze", "research", "study", "significance"):
-   - Use **## Key Findings** headers
-   - Include **bold** key terms and important values
-   - Use bullet points for multiple findings: • **Finding**: explanation
-   - Add horizontal separators (---) between sections
-   - Provide 2-3 well-formatted paragraphs with context
-   - Include background information about ocean processes
-   - Explain the significance of the findings
-   - Mention implications for climate/marine research
+    The client (and its pooled keep-alive HTTP connections) is created on
+    first use and shared by every request. Calls are awaited on the event loop
+    through ``client.aio``, at most ``max_concurrency`` at a time, and each is
+    cancelled after ``timeout`` seconds.
+    """
 
-2. **DATA REQUESTS** (when user asks "show me", "give me", "what is the", "temperature", "salinity", specific values):
-   - Use **bold** for key values and measurements
-   - Format as: **Temperature**: 25.2°C - 28.7°C
-   - Use bullet points for multiple data points
-   - Add **## Data Summary** header
-   - Keep it concise but visually formatted
+    def __init__(self, max_concurrency: int = GEMINI_MAX_CONCURRENCY, timeout: float = GEMINI_TIMEOUT):
+        self.timeout = timeout
+        self._client: Optional[genai.Client] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+
+    @property
+    def client(self) -> genai.Client:
+        if self._client is None:
+            self._client = create_genai_client()
+        return self._client
+
+    async def generate_content(self, **kwargs: Any) -> types.GenerateContentResponse:
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.monotonic()
+            try:
+                return await asyncio.wait_for(
+                    self.client.aio.models.generate_content(**kwargs), self.timeout
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise TimeoutError(f"Gemini did not answer within {self.timeout:g}s")
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.calls += 1
+                self.total_seconds += time.monotonic() - started
 
-3. **GENERAL QUERIES** (mixed or unclear intent):
-   - Use **## Overview** header
-   - Include **bold** key findings
-   - Use bullet points for multiple points
-   - 1-2 well-formatted paragraphs with context
+    async def generate_content_stream(self, **kwargs: Any) -> AsyncIterator[str]:
+        """Yield the text of each chunk as Gemini generates it.
 
-**FORMATTING REQUIREMENTS**:
-- Always use **bold** for important values, measurements, and key terms
-- Use bullet points (•) for lists and multiple findings
-- Use ## headers for main sections
-- Use --- for visual separators between sections
-- Make the text visually appealing and scannable
+        ``timeout`` covers the whole generation, not each chunk.
+        """
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.monotonic()
+            stream = None
+            try:
+                stream = await asyncio.wait_for(
+                    self.client.aio.models.generate_content_stream(**kwargs), self.timeout
+                )
+                while True:
+                    remaining = started + self.timeout - time.monotonic()
+                    try:
+                        chunk = await asyncio.wait_for(anext(stream), remaining)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        yield chunk.text
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise TimeoutError(f"Gemini did not finish within {self.timeout:g}s")
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                if stream is not None:
+                    await stream.aclose()
+                self.in_flight -= 1
+                self.calls += 1
+                self.total_seconds += time.monotonic() - started
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "mean_seconds": round(self.total_seconds / self.calls, 3) if self.calls else None,
+        }
 
-Choose the appropriate style based on the user's query, but ALWAYS include rich Markdown formatting.
-"""
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=analysis_prompt,
-        )
-        return response.text
-    except Exception as e:
-        # Fallback to basic analysis if Gemini fails
-        return f"## Data Summary\n\n• **Data Found**: Oceanographic measurements in your requested region\n• **Source**: **Argo autonomous floats**\n• **Use**: Climate research and marine studies\n\n---\n\nThis data provides valuable insights into ocean conditions for scientific research."
+gemini = GeminiService()
 
 
 # --- Helper: call Gemini with function declarations ---
-def gemini_select_region(
+async def gemini_select_region(
     query: str, similar_chats: List[Dict] = None, conversation_history: List[str] = None
 ) -> Dict[str, Any]:
     """Send the query to Gemini with context from similar previous chats and conversation history.
@@ -303,8 +541,6 @@ def gemini_select_region(
       - function_call: {name, args}   OR
       - text: string (if no function call)
     """
-    client = create_genai_client()
-
     # Build context from similar chats
     context_prompt = ""
     if similar_chats:
@@ -340,7 +576,7 @@ def gemini_select_region(
     tools = types.Tool(function_declarations=[select_region_function])
     config = types.GenerateContentConfig(tools=[tools])
 
-    response = client.models.generate_content(
+    response = await gemini.generate_content(
         model="gemini-2.5-flash",
         contents=enhanced_query,
         config=config,
@@ -497,15 +733,44 @@ def generate_graph_analysis(
         }
 
 
-def generate_data_analysis(
+def describe_depth_stats(stats: Optional[Dict[str, Any]]) -> str:
+    """Render the region-wide depth-binned means as prompt lines."""
+    if not stats:
+        return ""
+    edges = stats["pres_bins"]
+    lines = ["Mean values by pressure bin (dbar), over all profiles in the region:"]
+    climatology = stats.get("climatology")
+    if climatology:
+        months = ", ".join(calendar.month_abbr[m] for m in climatology["months"])
+        start, end = climatology["period"]
+        lines[0] = (
+            f"Climatological mean values by pressure bin (dbar) for {months}, "
+            f"over all Argo profiles in the region from {start} to {end}:"
+        )
+    for var in stats["variables"]:
+        means = stats["overall"][var]["mean"]
+        parts = [
+            f"{edges[i]:g}-{edges[i + 1]:g}: {value}"
+            for i, value in enumerate(means)
+            if value is not None
+        ]
+        lines.append(f"- {var}: " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+# --- Helper: generate dynamic analysis using Gemini ---
+async def generate_data_analysis(
     query: str,
     data_result: Dict[str, Any],
     query_meta: Dict[str, Any],
     similar_chats: List[Dict] = None,
+    on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> str:
-    """Generate a dynamic analysis of the ocean data based on the user's query and results."""
-    client = create_genai_client()
+    """Generate a dynamic analysis of the ocean data based on the user's query and results.
 
+    The analysis is streamed from Gemini; ``on_delta`` is awaited with each
+    piece of text as it arrives. Returns the full text.
+    """
     # Prepare data summary for Gemini
     data_summary = ""
     if data_result.get("summary"):
@@ -519,6 +784,8 @@ def generate_data_analysis(
         successful = [s for s in summaries if not s.get("error")]
         data_summary = f"Found data from {len(successful)} out of {len(summaries)} requested locations"
 
+    depth_summary = describe_depth_stats(data_result.get("depth_stats"))
+
     # Build context from similar chats
     context_section = ""
     if similar_chats:
@@ -543,6 +810,7 @@ Query details:
 
 Data results:
 {data_summary}
+{depth_summary}
 
 RESPONSE STYLE GUIDELINES:
 
@@ -581,571 +849,2630 @@ RESPONSE STYLE GUIDELINES:
 Choose the appropriate style based on the user's query, but ALWAYS include rich Markdown formatting.
 """
 
+    parts = []
+    chunks = gemini.generate_content_stream(
+        model="gemini-2.0-flash-exp",
+        contents=analysis_prompt,
+    )
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=analysis_prompt,
-        )
-        return response.text
-    except Exception as e:
+        while True:
+            # Only Gemini failures fall back; a failed send to the client
+            # (e.g. a closed socket) propagates and ends the request
+            try:
+                text = await anext(chunks)
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                print(f"Analysis stream failed: {e}")
+                break
+            parts.append(text)
+            if on_delta is not None:
+                await on_delta(text)
+    finally:
+        await chunks.aclose()
+    if parts:
+        # Keep whatever was generated (and already shown) before a failure
+        return "".join(parts)
+    else:
         # Fallback to basic analysis if Gemini fails
         return f"## Data Summary\n\n• **Data Found**: Oceanographic measurements in your requested region\n• **Source**: **Argo autonomous floats**\n• **Use**: Climate research and marine studies\n\n---\n\nThis data provides valuable insights into ocean conditions for scientific research."
 
 
-# --- Helper: fetch data from Argopy for a bounding box or points ---
-def fetch_argopy_for_box(
-    box: Dict[str, float],
-    date_min: Optional[str] = None,
-    date_max: Optional[str] = None,
-) -> Dict[str, Any]:
-    date_min, date_max = normalize_date_range(date_min, date_max)
+# --- Helper: persistent cache for Argo region fetches ---
+class ArgoRegionCache:
+    """On-disk Parquet cache of Argo region DataFrames with size-based LRU eviction.
 
-    region = [
-        box["lon_min"],
-        box["lon_max"],
-        box["lat_min"],
-        box["lat_max"],
-        0,
-        2000,
-        date_min,
-        date_max,
-    ]
+    Entries are keyed by the normalized box and ISO date range. Months close to
+    today are still being filled in upstream (late floats, delayed-mode QC), so
+    entries ending in that window expire after ``recent_ttl`` seconds; older
+    entries only leave the cache when evicted.
+    """
 
-    argo = ArgoDataFetcher()
-    ds = argo.region(region).to_dataframe()
-    # Convert to JSON-serializable structure (limit sample size) and sanitize
-    try:
-        total_count = len(ds)
-    except Exception:
-        total_count = None
+    def __init__(
+        self, directory: str, max_bytes: int, recent_months: int, recent_ttl: int
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.recent_months = recent_months
+        self.recent_ttl = recent_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._thread = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(box: Dict[str, float], date_start: str, date_end: str) -> str:
+        return (
+            f"{box['lon_min']:.4f}_{box['lon_max']:.4f}_"
+            f"{box['lat_min']:.4f}_{box['lat_max']:.4f}_{date_start}_{date_end}"
+        )
 
-    def sanitize(value: Any) -> Any:
-        if value is None:
-            return None
-        if isinstance(value, float):
-            return value if math.isfinite(value) else None
-        if isinstance(value, (int, str, bool)):
-            return value
-        if isinstance(value, (datetime.date, datetime.datetime)):
+    def _load_index(self) -> None:
+        # Rebuild the LRU order from the files left by a previous process,
+        # oldest write first.
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.directory, name)
             try:
-                return value.isoformat()
-            except Exception:
-                return str(value)
-        if isinstance(value, dict):
-            return {k: sanitize(v) for k, v in value.items()}
-        if isinstance(value, (list, tuple)):
-            return [sanitize(v) for v in value]
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name[: -len(".parquet")], path, stat.st_size))
+        for mtime, key, path, size in sorted(files):
+            self._entries[key] = {
+                "path": path,
+                "size": size,
+                "created": mtime,
+                "date_end": key.rsplit("_", 1)[-1],
+            }
+            self._total_bytes += size
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        today = datetime.date.today()
+        months_back = today.year * 12 + today.month - 1 - self.recent_months
+        cutoff = datetime.date(months_back // 12, months_back % 12 + 1, 1)
+        if entry["date_end"] < cutoff.isoformat():
+            return False
+        return time.time() - entry["created"] > self.recent_ttl
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry["size"]
         try:
-            if hasattr(value, "item"):
-                return sanitize(value.item())
-        except Exception:
+            os.remove(entry["path"])
+        except OSError:
             pass
-        return str(value)
 
-    try:
-        # Instead of taking first 50 records (which may all be from same location/time),
-        # sample unique lat/lon/time combinations to get diverse data
-        unique_combinations = ds[["LATITUDE", "LONGITUDE", "TIME"]].drop_duplicates()
+    def get(self, key: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """Return the cached frame for ``key``, reading only ``columns`` if given."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self._thread.misses = self.thread_misses() + 1
+                return None
+            self._entries.move_to_end(key)
+            path = entry["path"]
+        try:
+            if columns is not None:
+                present = set(pq.read_schema(path).names)
+                columns = [c for c in columns if c in present]
+            df = pd.read_parquet(path, columns=columns)
+        except Exception as e:
+            print(f"Dropping unreadable cache entry {key}: {e}")
+            with self._lock:
+                self._remove(key)
+                self.misses += 1
+            self._thread.misses = self.thread_misses() + 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def thread_misses(self) -> int:
+        """Misses so far on the calling thread, to tell if one fetch was served from cache."""
+        return getattr(self._thread, "misses", 0)
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        path = os.path.join(self.directory, f"{key}.parquet")
+        tmp_path = f"{path}.{uuid4().hex}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)["size"]
+            self._entries[key] = {
+                "path": path,
+                "size": size,
+                "created": time.time(),
+                "date_end": key.rsplit("_", 1)[-1],
+            }
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
 
-        # Take up to 50 unique combinations, or all if less than 50
-        if len(unique_combinations) <= 50:
-            sampled_data = unique_combinations
-        else:
-            # Sample every nth record to get diverse data
-            step = max(1, len(unique_combinations) // 50)
-            sampled_data = unique_combinations.iloc[::step].head(50)
-
-        # Now get the full records for these unique combinations
-        # Merge back with original data to get all columns
-        merged_data = sampled_data.merge(
-            ds, on=["LATITUDE", "LONGITUDE", "TIME"], how="left"
-        )
 
-        # Take one record per unique combination (they should all be the same except for depth-related columns)
-        final_data = merged_data.drop_duplicates(
-            subset=["LATITUDE", "LONGITUDE", "TIME"]
-        )
+argo_cache = ArgoRegionCache(
+    ARGO_CACHE_DIR,
+    ARGO_CACHE_MAX_BYTES,
+    ARGO_CACHE_RECENT_MONTHS,
+    ARGO_CACHE_RECENT_TTL,
+)
 
-        raw_records = final_data.to_dict(orient="records")
-        sample_records = sanitize(raw_records)
-    except Exception:
-        # Fallback: stringify if conversion fails
-        sample_records = [str(ds)]
-    return {"summary": sample_records, "total": total_count}
+# Where raw profiles come from (argopy, or a local Postgres/SQLite copy)
+data_source = create_data_source()
 
+# Precomputed monthly climatology for aggregate questions (None until built)
+climatology_cube = ClimatologyCube.load()
 
-def fetch_argopy_for_points(
-    points: List[Dict[str, float]],
-    date_min: Optional[str] = None,
-    date_max: Optional[str] = None,
-) -> Dict[str, Any]:
-    combined = {"summaries": []}
-    for p in points:
-        box = {
-            "lon_min": p["lon"] - 0.1,
-            "lon_max": p["lon"] + 0.1,
-            "lat_min": p["lat"] - 0.1,
-            "lat_max": p["lat"] + 0.1,
-        }
-        try:
-            res = fetch_argopy_for_box(box, date_min, date_max)
-            combined["summaries"].append(
-                {"point": p, "summary": res.get("summary"), "total": res.get("total")}
-            )
-        except Exception as exc:
-            combined["summaries"].append({"point": p, "error": str(exc)})
-    return combined
 
+# --- Helper: spatio-temporal tiling of Argo region fetches ---
+def _month_end(month_start: datetime.date) -> datetime.date:
+    return month_start.replace(day=calendar.monthrange(month_start.year, month_start.month)[1])
 
-# --- WebSocket endpoint ---
-@app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
-    await ws.accept()
-    try:
-        conversation_history = []
-        session_id = str(uuid4())
-        while True:
-            data = await ws.receive_text()
-            print(f"Received data: {data}")
-            try:
-                payload = json.loads(data)
-            except json.JSONDecodeError:
-                await ws.send_text(
-                    json.dumps({"error": 'Invalid JSON. Send {"query": "..."}'})
-                )
-                continue
 
-            query = payload.get("query")
-            conversation_history.append(query)
-            if not query:
-                await ws.send_text(json.dumps({"error": "Missing 'query' in payload."}))
-                continue
+def _next_month(month_start: datetime.date) -> datetime.date:
+    return _month_end(month_start) + datetime.timedelta(days=1)
 
-            # Stage 1: Analyzing
-            await ws.send_text(
-                json.dumps(
-                    {
-                        "stage": "analyzing",
-                        "message": "🔎 Analyzing your query",
-                        "thinking": [
-                            "Understanding the ocean data request",
-                            "Searching for similar previous queries",  # Add this line
-                            "Identifying geographical parameters",
-                            "Determining time range requirements",
-                            "Selecting relevant ocean variables",
-                            "Validating query parameters",
-                            "Preparing for AI processing",
-                        ],
-                    }
-                )
-            )
 
-            # Search for similar chats before calling Gemini
-            similar_chats = search_similar_chats(
-                query, n_results=3, similarity_threshold=0.7
-            )
-            print(f"Found {len(similar_chats)} similar previous chats")
+def _months_in_range(date_start: str, date_end: str) -> List[datetime.date]:
+    months = []
+    month = datetime.date.fromisoformat(date_start).replace(day=1)
+    last = datetime.date.fromisoformat(date_end)
+    while month <= last:
+        months.append(month)
+        month = _next_month(month)
+    return months
 
-            loop = asyncio.get_running_loop()
-            try:
-                gemini_result = await loop.run_in_executor(
-                    None,
-                    gemini_select_region,
-                    query,
-                    similar_chats,
-                    conversation_history,
-                )
-            except Exception as exc:
-                await ws.send_text(
-                    json.dumps(
-                        {"stage": "error", "message": f"Gemini call failed: {exc}"}
-                    )
-                )
-                continue
 
-            if "function_call" in gemini_result:
-                fc = gemini_result["function_call"]
+def _region_tiles(box: Dict[str, float], date_start: str, date_end: str) -> List[tuple]:
+    """List the (lon index, lat index, month start) tiles covering a region."""
+    ix_min = math.floor(box["lon_min"] / ARGO_TILE_DEG)
+    ix_max = max(ix_min + 1, math.ceil(box["lon_max"] / ARGO_TILE_DEG))
+    iy_min = math.floor(box["lat_min"] / ARGO_TILE_DEG)
+    iy_max = max(iy_min + 1, math.ceil(box["lat_max"] / ARGO_TILE_DEG))
+    months = _months_in_range(date_start, date_end)
+    return [
+        (ix, iy, m)
+        for m in months
+        for ix in range(ix_min, ix_max)
+        for iy in range(iy_min, iy_max)
+    ]
 
-                # Stage 2: Generating SQL
-                print(f"Generating SQL for function call: {fc}")
-                await ws.send_text(
-                    json.dumps(
-                        {
-                            "stage": "sql_generation",
-                            "message": "🛠 Generating SQL for your request",
-                            "thinking": [
-                                "Parsing natural language to structured query",
-                                "Extracting geographical coordinates",
-                                "Building database query parameters",
-                                "Validating query constraints",
-                                "Optimizing query performance",
-                                "Preparing data retrieval strategy",
-                            ],
-                        }
-                    )
-                )
 
-                args = fc.get("args", {})
-                if fc["name"] == "select_region":
-                    mode = args.get("mode")
-                    date_min = args.get("date_min")
-                    date_max = args.get("date_max")
-                    variables = args.get("variables", [])
-
-                    # Build query meta (normalized date range) to send back to frontend
-                    nm_start, nm_end = normalize_date_range(date_min, date_max)
-                    query_meta = {
-                        "mode": mode,
-                        "date_min_provided": date_min,
-                        "date_max_provided": date_max,
-                        "date_start": nm_start,
-                        "date_end": nm_end,
-                        "selected_variables": variables,
-                    }
+def _tile_key(tile: tuple) -> str:
+    ix, iy, month = tile
+    box = {
+        "lon_min": ix * ARGO_TILE_DEG,
+        "lon_max": (ix + 1) * ARGO_TILE_DEG,
+        "lat_min": iy * ARGO_TILE_DEG,
+        "lat_max": (iy + 1) * ARGO_TILE_DEG,
+    }
+    return argo_cache.make_key(box, month.isoformat(), _month_end(month).isoformat())
 
-                    try:
-                        # Stage 3: Fetching from DB
-                        print(
-                            f"Fetching data for mode: {mode}, date_min: {date_min}, date_max: {date_max}, args: {args}"
-                        )
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "stage": "db_fetch",
-                                    "message": "📡 Fetching data from PostgreSQL",
-                                    "thinking": [
-                                        "Connecting to Argo global database",
-                                        "Querying ocean float measurements",
-                                        "Filtering by geographical region",
-                                        "Applying time range constraints",
-                                        "Retrieving temperature, salinity, and pressure data",
-                                        "Validating data quality and completeness",
-                                        "Organizing results by location and time",
-                                    ],
-                                }
-                            )
-                        )
 
-                        if mode == "box":
-                            box = args.get("box")
-                            if not box:
-                                raise ValueError(
-                                    "Gemini returned mode 'box' but no box provided"
-                                )
-
-                            # Try the original box first
-                            try:
-                                raw_result = await loop.run_in_executor(
-                                    None, fetch_argopy_for_box, box, date_min, date_max
-                                )
-                                query_meta["box"] = box
-                            except (
-                                FileNotFoundError,
-                                FSTimeoutError,
-                                asyncio.TimeoutError,
-                                aiohttp.ClientError,
-                            ):
-                                # If original box fails, try with a broader area
-                                print(f"Original box failed, trying broader area...")
-                                broader_box = {
-                                    "lon_min": max(-180, box["lon_min"] - 2.0),
-                                    "lon_max": min(180, box["lon_max"] + 2.0),
-                                    "lat_min": max(-90, box["lat_min"] - 2.0),
-                                    "lat_max": min(90, box["lat_max"] + 2.0),
-                                }
-                                try:
-                                    raw_result = await loop.run_in_executor(
-                                        None,
-                                        fetch_argopy_for_box,
-                                        broader_box,
-                                        date_min,
-                                        date_max,
-                                    )
-                                    query_meta["box"] = broader_box
-                                    query_meta["expanded_search"] = True
-                                    print(
-                                        f"Successfully found data with broader search area"
-                                    )
-                                except Exception:
-                                    # Re-raise the original exception if broader search also fails
-                                    raise
-
-                        elif mode == "points":
-                            points = args.get("points", [])
-                            if not points:
-                                raise ValueError(
-                                    "Gemini returned mode 'points' but no points provided"
-                                )
-                            raw_result = await loop.run_in_executor(
-                                None,
-                                fetch_argopy_for_points,
-                                points,
-                                date_min,
-                                date_max,
-                            )
-                            query_meta["points"] = points
-
-                        else:
-                            await ws.send_text(
-                                json.dumps(
-                                    {
-                                        "stage": "error",
-                                        "message": f"Unknown mode from Gemini: {mode}",
-                                    }
-                                )
-                            )
-                            continue
-
-                        # Stage 4: Processing data
-                        print(
-                            f"Fetching data for mode: {mode}, date_min: {date_min}, date_max: {date_max}, args: {args}"
-                        )
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "stage": "processing",
-                                    "message": "⚙️ Processing data",
-                                    "thinking": [
-                                        "Cleaning and validating ocean measurements",
-                                        "Filtering data by requested variables",
-                                        "Organizing results by location and time",
-                                        "Preparing data for visualization",
-                                        "Generating summary statistics",
-                                        "Creating data quality reports",
-                                        "Finalizing analysis results",
-                                    ],
-                                }
-                            )
-                        )
-                        # result = process_data(raw_result)  # wrap your pandas/cleaning logic here
-                        result = raw_result
-
-                        # Optional filtering to requested variables, keep full data for toggle
-                        def pick_columns(records, variables_list):
-                            if not isinstance(records, list) or not records:
-                                return records
-                            present_keys = set(records[0].keys())
-
-                            def find_key(candidates):
-                                for c in candidates:
-                                    if c in present_keys:
-                                        return c
-                                    up = c.upper()
-                                    if up in present_keys:
-                                        return up
-                                    ti = c.title()
-                                    if ti in present_keys:
-                                        return ti
-                                return None
-
-                            essential_candidates = [
-                                ["LATITUDE", "latitude", "Lat"],
-                                ["LONGITUDE", "longitude", "Lon"],
-                                ["TIME", "time", "Date", "date"],
-                            ]
-                            essential = [
-                                fk
-                                for group in essential_candidates
-                                for fk in ([find_key(group)] if find_key(group) else [])
-                            ]
-                            var_map = {
-                                "temperature": ["TEMP", "temperature", "temp"],
-                                "salinity": ["PSAL", "salinity", "sal"],
-                                "pressure": ["PRES", "pressure", "pres"],
-                            }
-                            selected_keys = []
-                            for v in variables_list or []:
-                                found = find_key(var_map.get(v, []))
-                                if found and found not in selected_keys:
-                                    selected_keys.append(found)
-                            if not selected_keys:
-                                return records
-                            keep = set(selected_keys + essential)
-                            return [
-                                {k: row.get(k) for k in keep if k in row}
-                                for row in records
-                            ]
-
-                        if variables:
-                            if isinstance(result, dict) and isinstance(
-                                result.get("summary"), list
-                            ):
-                                full_summary = result["summary"]
-                                filtered_summary = pick_columns(full_summary, variables)
-                                result = {
-                                    **result,
-                                    "full_summary": full_summary,
-                                    "summary": filtered_summary,
-                                }
-                            elif isinstance(result, dict) and isinstance(
-                                result.get("summaries"), list
-                            ):
-                                new_summaries = []
-                                for item in result["summaries"]:
-                                    if isinstance(item, dict) and isinstance(
-                                        item.get("summary"), list
-                                    ):
-                                        fs = item["summary"]
-                                        new_summaries.append(
-                                            {
-                                                **item,
-                                                "full_summary": fs,
-                                                "summary": pick_columns(fs, variables),
-                                            }
-                                        )
-                                    else:
-                                        new_summaries.append(item)
-                                result = {**result, "summaries": new_summaries}
-
-                        # Stage 5: Generate dynamic analysis
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "stage": "completed",
-                                    "message": "✅ Generating analysis",
-                                    "thinking": [
-                                        "Finalizing data processing",
-                                        "Preparing response format",
-                                        "Generating user-friendly summary",
-                                        "Ready to display results",
-                                    ],
-                                }
-                            )
-                        )
+def _fetch_argo_region(
+    box: Dict[str, float], date_start: str, date_end: str
+) -> pd.DataFrame:
+    return data_source.fetch_region(box, date_start, date_end)
 
-                        # Add a small delay to let the thinking animation complete
-                        await asyncio.sleep(2)
-
-                        # Generate dynamic analysis using Gemini
-                        # Generate dynamic analysis using Gemini
-                        try:
-                            dynamic_analysis = await loop.run_in_executor(
-                                None,
-                                generate_data_analysis,
-                                query,
-                                result,
-                                query_meta,
-                                similar_chats,
-                            )
-                            result["dynamic_analysis"] = dynamic_analysis
-
-                            # Generate graph analysis for visualization
-                            graph_analysis = generate_graph_analysis(result, query_meta)
-                            result["graph_analysis"] = graph_analysis
-
-                            # Store user query and its dynamic analysis in Chroma DB
-                            doc_id = str(uuid4())
-                            chat_embeddings_collection.add(
-                                ids=[doc_id],
-                                documents=[dynamic_analysis],
-                                metadatas=[
-                                    {
-                                        "query": query,
-                                        "timestamp": datetime.datetime.utcnow().isoformat(),
-                                        "query_meta": json.dumps(query_meta),
-                                        "id": doc_id,
-                                    }
-                                ],
-                            )
-                            print(f"Stored analysis with ID: {doc_id}")
-
-                            # Log similar chats found
-                            if similar_chats:
-                                print(
-                                    f"Used context from {len(similar_chats)} similar previous queries"
-                                )
-                                for chat in similar_chats:
-                                    print(
-                                        f"  - Similar: '{chat['query'][:50]}...' (similarity: {1 - chat['distance']:.2f})"
-                                    )
-
-                        except Exception as e:
-                            print(f"Failed to generate dynamic analysis: {e}")
-                            result["dynamic_analysis"] = (
-                                "Analysis generation failed, showing data results."
-                            )
-
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "stage": "result",
-                                    "result": result,
-                                    "query_meta": query_meta,
-                                },
-                                default=str,
-                                allow_nan=False,
-                            )
-                        )
-                        # print(f"Sent result: {result}")
-
-                    except (
-                        FSTimeoutError,
-                        asyncio.TimeoutError,
-                        aiohttp.ClientError,
-                        FileNotFoundError,
-                    ) as exc:
-                        # Soft-fail on network/data errors: return a friendly result instead of an error stage
-                        error_type = (
-                            "timeout"
-                            if isinstance(exc, (FSTimeoutError, asyncio.TimeoutError))
-                            else "no_data"
-                        )
 
-                        if error_type == "no_data":
-                            friendly_message = (
-                                "## No Data Found\n\n"
-                                "No ocean data was found for your requested region and time period.\n\n"
-                                "**Possible reasons:**\n"
-                                "• Limited **Argo float** coverage in this region\n"
-                                "• No measurements available in the specified time period\n"
-                                "• Area is outside the main **Argo network**\n\n"
-                                "**Solution:** Try expanding your search area or using a different time period."
-                            )
-                        else:
-                            friendly_message = (
-                                "## Timeout Error\n\n"
-                                "The **ocean data source** timed out while fetching results.\n\n"
-                                "**Solution:** Try a smaller date range or a narrower region, then try again."
-                            )
-
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "stage": "result",
-                                    "result": friendly_message,
-                                    "query_meta": query_meta,
-                                },
-                                allow_nan=False,
-                            )
-                        )
-                    except Exception as exc:
-                        tb = traceback.format_exc()
-                        await ws.send_text(
-                            json.dumps(
-                                {
-                                    "stage": "error",
-                                    "message": f"Error during fetch/processing: {str(exc)}",
-                                    "traceback": tb,
-                                }
-                            )
-                        )
-                else:
-                    await ws.send_text(
-                        json.dumps(
-                            {
-                                "stage": "error",
-                                "message": "Unknown function requested by Gemini.",
-                            }
-                        )
-                    )
-            else:
-                text = gemini_result.get("text", "")
-                await ws.send_text(
-                    json.dumps({"stage": "no_function_call", "message": text})
-                )
+def _group_missing_tiles(missing: List[tuple]) -> List[List[tuple]]:
+    """Group missing tiles into runs of consecutive months with the same footprint.
 
-    except WebSocketDisconnect:
-        print("Client disconnected")
+    Each group is fetched with one request over its enclosing region, so tiles
+    that are already cached are not downloaded again alongside the new ones.
+    """
+    by_month: "OrderedDict[datetime.date, List[tuple]]" = OrderedDict()
+    for tile in sorted(missing, key=lambda t: t[2]):
+        by_month.setdefault(tile[2], []).append(tile)
+
+    groups = []
+    previous_month, previous_cells = None, None
+    for month, month_tiles in by_month.items():
+        cells = {(t[0], t[1]) for t in month_tiles}
+        if (
+            groups
+            and cells == previous_cells
+            and _next_month(previous_month) == month
+        ):
+            groups[-1].extend(month_tiles)
+        else:
+            groups.append(list(month_tiles))
+        previous_month, previous_cells = month, cells
+    return groups
+
+
+def _fetch_missing_tiles(missing: List[tuple]) -> Dict[tuple, pd.DataFrame]:
+    """Fetch the enclosing region of ``missing`` in one request and split it per tile.
+
+    Tiles without any profile are returned as empty frames so that they are
+    cached too and not requested again.
+    """
+    box = {
+        "lon_min": min(t[0] for t in missing) * ARGO_TILE_DEG,
+        "lon_max": (max(t[0] for t in missing) + 1) * ARGO_TILE_DEG,
+        "lat_min": min(t[1] for t in missing) * ARGO_TILE_DEG,
+        "lat_max": (max(t[1] for t in missing) + 1) * ARGO_TILE_DEG,
+    }
+    first_month = min(t[2] for t in missing)
+    next_month = _next_month(max(t[2] for t in missing))
+    try:
+        ds = _fetch_argo_region(box, first_month.isoformat(), next_month.isoformat())
+    except FileNotFoundError:
+        # argopy signals an empty region with FileNotFoundError
+        ds = pd.DataFrame()
+
+    if ds.empty:
+        return {tile: ds for tile in missing}
+
+    ds = ds.dropna(subset=["LONGITUDE", "LATITUDE", "TIME"])
+    ix = (ds["LONGITUDE"] // ARGO_TILE_DEG).astype(int)
+    iy = (ds["LATITUDE"] // ARGO_TILE_DEG).astype(int)
+    months = ds["TIME"].dt.year * 12 + ds["TIME"].dt.month - 1
+    groups = {key: group for key, group in ds.groupby([ix, iy, months], sort=False)}
+    empty = ds.iloc[0:0]
+    return {
+        tile: groups.get((tile[0], tile[1], tile[2].year * 12 + tile[2].month - 1), empty)
+        for tile in missing
+    }
+
+
+def _fetch_region_tiled(
+    box: Dict[str, float],
+    date_start: str,
+    date_end: str,
+    tiles: List[tuple],
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    frames = {}
+    missing = []
+    for tile in tiles:
+        frame = argo_cache.get(_tile_key(tile), columns)
+        if frame is None:
+            missing.append(tile)
+        else:
+            frames[tile] = frame
+
+    if missing:
+        print(f"Fetching {len(missing)} of {len(tiles)} tiles from argopy")
+        for group in _group_missing_tiles(missing):
+            for tile, frame in _fetch_missing_tiles(group).items():
+                try:
+                    argo_cache.put(_tile_key(tile), frame)
+                except Exception as e:
+                    print(f"Failed to cache Argo tile {_tile_key(tile)}: {e}")
+                frames[tile] = _select_columns(frame, columns)
+
+    non_empty = [frames[tile] for tile in tiles if not frames[tile].empty]
+    if not non_empty:
+        raise FileNotFoundError("No Argo data found for the requested region")
+    ds = pd.concat(non_empty, ignore_index=True)
+
+    time_end = pd.Timestamp(date_end) + pd.Timedelta(days=1)
+    mask = (
+        ds["LONGITUDE"].between(box["lon_min"], box["lon_max"])
+        & ds["LATITUDE"].between(box["lat_min"], box["lat_max"])
+        & (ds["TIME"] >= pd.Timestamp(date_start))
+        & (ds["TIME"] < time_end)
+    )
+    ds = ds[mask].reset_index(drop=True)
+    if ds.empty:
+        raise FileNotFoundError("No Argo data found for the requested region")
+    return ds
+
+
+def columns_for_variables(variables: Optional[List[str]]) -> Optional[List[str]]:
+    """Map Gemini's selected variables to DataFrame columns (None means all)."""
+    selected = [c for v in variables or [] for c in VARIABLE_COLUMNS.get(v, [])]
+    if not selected:
+        return None
+    return COORDINATE_COLUMNS + [c for c in dict.fromkeys(selected)]
+
+
+def _select_columns(ds: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    if columns is None:
+        return ds
+    return ds[[c for c in columns if c in ds.columns]]
+
+
+def fetch_region_dataframe(
+    box: Dict[str, float],
+    date_start: str,
+    date_end: str,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """Return the raw Argo profiles for a box and normalized date range.
+
+    Regions are assembled from cached 1-month tiles so that overlapping or
+    widened queries only fetch the tiles not yet held locally. Very large
+    regions fall back to caching the box as a whole. When ``columns`` is given
+    only those columns are read back from the cache and kept in memory; the
+    cache itself always holds every column so that other variables can be
+    served later without a new download.
+
+    Local data sources (see datastore.py) are queried directly, since they
+    already index the rows on disk.
+    """
+    if not data_source.cacheable:
+        return _select_columns(
+            _fetch_argo_region(box, date_start, date_end), columns
+        )
+
+    tiles = _region_tiles(box, date_start, date_end)
+    if len(tiles) <= ARGO_MAX_TILES:
+        return _fetch_region_tiled(box, date_start, date_end, tiles, columns)
+
+    cache_key = argo_cache.make_key(box, date_start, date_end)
+    ds = argo_cache.get(cache_key, columns)
+    if ds is None:
+        ds = _fetch_argo_region(box, date_start, date_end)
+        try:
+            argo_cache.put(cache_key, ds)
+        except Exception as e:
+            print(f"Failed to cache Argo region {cache_key}: {e}")
+        ds = _select_columns(ds, columns)
+    return ds
+
+
+# --- Helper: fetch data from Argopy for a bounding box or points ---
+def _sanitize_value(value: Any) -> Any:
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (int, str, bool)):
+        return value
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        try:
+            return value.isoformat()
+        except Exception:
+            return str(value)
+    if isinstance(value, dict):
+        return {k: _sanitize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sanitize_value(v) for v in value]
+    try:
+        if hasattr(value, "item"):
+            return _sanitize_value(value.item())
+    except Exception:
+        pass
+    return str(value)
+
+
+def _column_to_list(series: pd.Series) -> List[Any]:
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) and not series.hasnans:
+        return series.to_numpy(dtype=bool).tolist()
+    if pd.api.types.is_integer_dtype(dtype) and not series.hasnans:
+        return series.to_numpy(dtype="int64").tolist()
+    if pd.api.types.is_float_dtype(dtype):
+        values = series.to_numpy(dtype="float64", na_value=np.nan)
+        out = values.astype(object)
+        out[~np.isfinite(values)] = None
+        return out.tolist()
+    if pd.api.types.is_datetime64_dtype(dtype):
+        values = series.to_numpy(dtype="datetime64[ns]")
+        missing = np.isnat(values)
+        if (values[~missing].astype("int64") % 1_000_000_000 != 0).any():
+            # Sub-second precision: keep Timestamp.isoformat() formatting
+            return [None if pd.isna(v) else v.isoformat() for v in series.tolist()]
+        out = np.datetime_as_string(values, unit="s").astype(object)
+        out[missing] = None
+        return out.tolist()
+    if dtype == object and pd.api.types.infer_dtype(series, skipna=False) == "string":
+        return series.tolist()
+    return [_sanitize_value(v) for v in series.astype(object).tolist()]
+
+
+def dataframe_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convert a DataFrame into JSON-safe records, one column at a time.
+
+    Produces the same records as sanitizing ``df.to_dict(orient="records")``
+    value by value: NaN/inf become None, datetimes ISO strings and numpy
+    scalars plain Python values.
+    """
+    names = list(df.columns)
+    if not names:
+        return [{} for _ in range(len(df))]
+    columns = [_column_to_list(df.iloc[:, i]) for i in range(len(names))]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _grid_bins(values: np.ndarray, n_bins: int) -> np.ndarray:
+    """Assign each value to one of ``n_bins`` equal-width bins over its range."""
+    values = values.astype("float64")
+    finite = np.isfinite(values)
+    if n_bins <= 1 or not finite.any():
+        return np.zeros(len(values), dtype="int64")
+    lo, hi = values[finite].min(), values[finite].max()
+    if not hi > lo:
+        return np.zeros(len(values), dtype="int64")
+    values = np.where(finite, values, lo)
+    return np.minimum(((values - lo) / (hi - lo) * n_bins).astype("int64"), n_bins - 1)
+
+
+def sample_profiles(
+    ds: pd.DataFrame, target: int = ARGO_SAMPLE_SIZE, seed: int = ARGO_SAMPLE_SEED
+) -> pd.DataFrame:
+    """Pick up to ``target`` profiles spread evenly over space and time.
+
+    Each profile (one row per LATITUDE/LONGITUDE/TIME) is binned into a grid of
+    about ``target`` lat/lon cells times ARGO_SAMPLE_TIME_BINS time slices.
+    Cells are then visited round-robin in a seeded random order, so every
+    occupied cell contributes one profile before a dense float cluster
+    contributes a second. The result keeps the original row order.
+    """
+    profiles = ds.drop_duplicates(subset=["LATITUDE", "LONGITUDE", "TIME"])
+    n = len(profiles)
+    if n <= target:
+        return profiles
+
+    side = max(1, math.ceil(math.sqrt(target)))
+    times = profiles["TIME"].to_numpy(dtype="datetime64[ns]")
+    time_values = np.where(np.isnat(times), np.nan, times.astype("int64"))
+    cell = (
+        _grid_bins(profiles["LATITUDE"].to_numpy(), side) * side
+        + _grid_bins(profiles["LONGITUDE"].to_numpy(), side)
+    ) * ARGO_SAMPLE_TIME_BINS + _grid_bins(time_values, ARGO_SAMPLE_TIME_BINS)
+
+    rng = np.random.default_rng(seed)
+    _, cell_index = np.unique(cell, return_inverse=True)
+    cell_priority = rng.random(cell_index.max() + 1)[cell_index]
+    row_priority = rng.random(n)
+
+    # Rank of each profile inside its cell, in random order
+    order = np.lexsort((row_priority, cell_index))
+    sorted_cells = cell_index[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    rank = np.empty(n, dtype="int64")
+    rank[order] = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+    picked = np.lexsort((cell_priority, rank))[:target]
+    return profiles.iloc[np.sort(picked)]
+
+
+class ProfileReservoir:
+    """Seeded bottom-k reservoir of candidate profiles from successive chunks.
+
+    Every candidate gets a random priority when added and the ``capacity``
+    lowest priorities are kept, so each candidate seen so far has the same
+    chance to be in the reservoir however many chunks came before it.
+    """
+
+    def __init__(self, capacity: int = ARGO_FETCH_RESERVOIR, seed: int = ARGO_SAMPLE_SEED):
+        self.capacity = capacity
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._priority = np.empty(0)
+        self.frame: Optional[pd.DataFrame] = None
+
+    def add(self, candidates: pd.DataFrame) -> None:
+        if candidates.empty:
+            return
+        self.seen += len(candidates)
+        priority = np.concatenate([self._priority, self._rng.random(len(candidates))])
+        frame = (
+            candidates
+            if self.frame is None
+            else pd.concat([self.frame, candidates], ignore_index=True)
+        )
+        if len(frame) > self.capacity:
+            keep = np.sort(np.argpartition(priority, self.capacity)[: self.capacity])
+            frame = frame.iloc[keep].reset_index(drop=True)
+            priority = priority[keep]
+        self.frame, self._priority = frame, priority
+
+
+# --- Helper: depth-binned profile statistics ---
+def _round_or_none(values: np.ndarray) -> List[Any]:
+    out = np.round(values.astype("float64"), 3).astype(object)
+    out[~np.isfinite(values.astype("float64"))] = None
+    return out.tolist()
+
+
+class DepthBinAccumulator:
+    """Mergeable TEMP/PSAL statistics on standard pressure bins.
+
+    ``add`` can be called once per chunk of raw rows: it keeps only
+    count/sum/min/max per (grid cell, pressure bin), plus the per-bin means of
+    the sampled profiles passed in, so the raw rows can be dropped afterwards.
+    ``result`` reports the region-wide bins; the per-cell and per-profile
+    detail is only included when asked for.
+    """
+
+    def __init__(
+        self,
+        bins: List[float] = STANDARD_PRESSURE_BINS,
+        cell_deg: float = DEPTH_STATS_CELL_DEG,
+    ):
+        self.edges = np.asarray(bins, dtype="float64")
+        self.cell_deg = cell_deg
+        self._cell_parts: List[pd.DataFrame] = []
+        self._profile_parts: List[pd.DataFrame] = []
+        self.variables: List[str] = []
+
+    def _pressure_bin(self, ds: pd.DataFrame) -> np.ndarray:
+        pres = ds["PRES"].to_numpy(dtype="float64", na_value=np.nan)
+        return pressure_bin_index(pres, self.edges)
+
+    def add(self, ds: pd.DataFrame, sample: Optional[pd.DataFrame] = None) -> None:
+        variables = [v for v in DEPTH_STAT_VARIABLES if v in ds.columns]
+        if "PRES" not in ds.columns or not variables or ds.empty:
+            return
+        self.variables = list(dict.fromkeys(self.variables + variables))
+        pbin = self._pressure_bin(ds)
+        valid = pbin >= 0
+        rows = ds.loc[valid, ["LATITUDE", "LONGITUDE", "TIME"] + variables]
+        pbin = pbin[valid]
+
+        ix = np.floor(rows["LONGITUDE"].to_numpy(dtype="float64") / self.cell_deg)
+        iy = np.floor(rows["LATITUDE"].to_numpy(dtype="float64") / self.cell_deg)
+        cells = rows[variables].groupby([ix, iy, pbin]).agg(["count", "sum", "min", "max"])
+        cells.index.names = ["ix", "iy", "bin"]
+        self._cell_parts.append(cells)
+        if len(self._cell_parts) > 8:
+            self._cell_parts = [self._combine_cells()]
+
+        if sample is not None and not sample.empty:
+            keys = ["LATITUDE", "LONGITUDE", "TIME"]
+            in_sample = pd.MultiIndex.from_frame(rows[keys]).isin(
+                pd.MultiIndex.from_frame(sample[keys])
+            )
+            profiles = (
+                rows[in_sample]
+                .groupby(keys + [pbin[in_sample]])[variables]
+                .mean()
+            )
+            profiles.index.names = keys + ["bin"]
+            self._profile_parts.append(profiles)
+
+    def keep_profiles(self, sample: pd.DataFrame) -> None:
+        """Drop the per-bin means of sampled profiles that are not in ``sample``."""
+        if not self._profile_parts:
+            return
+        keys = ["LATITUDE", "LONGITUDE", "TIME"]
+        profiles = pd.concat(self._profile_parts)
+        wanted = pd.MultiIndex.from_frame(sample[keys])
+        self._profile_parts = [profiles[profiles.index.droplevel("bin").isin(wanted)]]
+
+    def _combine_cells(self) -> pd.DataFrame:
+        combined = pd.concat(self._cell_parts)
+        how = {col: ("sum" if col[1] in ("count", "sum") else col[1]) for col in combined.columns}
+        return combined.groupby(level=["ix", "iy", "bin"]).agg(how)
+
+    def _bin_matrix(self, series: pd.Series, rows: pd.Index) -> np.ndarray:
+        matrix = series.unstack("bin").reindex(
+            index=rows, columns=range(len(self.edges) - 1)
+        )
+        return matrix.to_numpy(dtype="float64", na_value=np.nan)
+
+    def result(self, detail: bool = False) -> Optional[Dict[str, Any]]:
+        """Per-bin stats over the whole region, plus ``cells`` and ``profiles`` if ``detail``."""
+        if not self._cell_parts:
+            return None
+        cells = self._combine_cells()
+        stats: Dict[str, Any] = {
+            "pres_bins": self.edges.tolist(),
+            "variables": self.variables,
+            "overall": {},
+        }
+        overall = cells.groupby(level="bin").agg(
+            {col: ("sum" if col[1] in ("count", "sum") else col[1]) for col in cells.columns}
+        ).reindex(range(len(self.edges) - 1))
+        if detail:
+            cell_index = cells.index.droplevel("bin").unique()
+            stats["cells"] = {
+                "cell_deg": self.cell_deg,
+                "lon": ((cell_index.get_level_values("ix") + 0.5) * self.cell_deg).tolist(),
+                "lat": ((cell_index.get_level_values("iy") + 0.5) * self.cell_deg).tolist(),
+            }
+        for var in self.variables:
+            if detail:
+                count = self._bin_matrix(cells[(var, "count")], cell_index)
+                mean = self._bin_matrix(cells[(var, "sum")], cell_index) / np.where(count > 0, count, np.nan)
+                stats["cells"][var] = {
+                    "mean": [_round_or_none(row) for row in mean],
+                    "min": [_round_or_none(row) for row in self._bin_matrix(cells[(var, "min")], cell_index)],
+                    "max": [_round_or_none(row) for row in self._bin_matrix(cells[(var, "max")], cell_index)],
+                    "count": np.nan_to_num(count).astype("int64").tolist(),
+                }
+            total = overall[(var, "count")].to_numpy(dtype="float64", na_value=0)
+            stats["overall"][var] = {
+                "mean": _round_or_none(
+                    overall[(var, "sum")].to_numpy(dtype="float64", na_value=np.nan)
+                    / np.where(total > 0, total, np.nan)
+                ),
+                "min": _round_or_none(overall[(var, "min")].to_numpy(dtype="float64", na_value=np.nan)),
+                "max": _round_or_none(overall[(var, "max")].to_numpy(dtype="float64", na_value=np.nan)),
+                "count": total.astype("int64").tolist(),
+            }
+
+        if detail and self._profile_parts:
+            profiles = pd.concat(self._profile_parts)
+            profile_index = profiles.index.droplevel("bin").unique()
+            stats["profiles"] = {
+                "LATITUDE": profile_index.get_level_values("LATITUDE").tolist(),
+                "LONGITUDE": profile_index.get_level_values("LONGITUDE").tolist(),
+                "TIME": _column_to_list(
+                    pd.Series(profile_index.get_level_values("TIME"))
+                ),
+            }
+            for var in self.variables:
+                if var in profiles.columns:
+                    matrix = self._bin_matrix(profiles[var], profile_index)
+                    stats["profiles"][var] = [_round_or_none(row) for row in matrix]
+        return stats
+
+
+def summarize_dataframe(
+    ds: pd.DataFrame,
+    target: int = ARGO_SAMPLE_SIZE,
+    columns: Optional[List[str]] = None,
+    depth_stats: Optional[DepthBinAccumulator] = None,
+    depth_detail: bool = False,
+) -> Dict[str, Any]:
+    """Sample a raw Argo DataFrame into the JSON-ready ``summary``/``total`` result.
+
+    ``columns`` limits the sampled records to the selected variables while the
+    depth statistics still use every row. Pass ``depth_stats`` to accumulate
+    statistics across several chunks of the same request, and ``depth_detail``
+    to include its per-cell and per-profile statistics.
+    """
+    # Convert to JSON-serializable structure (limit sample size) and sanitize
+    try:
+        total_count = len(ds)
+    except Exception:
+        total_count = None
+
+    if depth_stats is None:
+        depth_stats = DepthBinAccumulator()
+    try:
+        sample = sample_profiles(ds, target)
+        sample_records = dataframe_to_records(_select_columns(sample, columns))
+    except Exception:
+        # Fallback: stringify if conversion fails
+        sample, sample_records = None, [str(ds)]
+    try:
+        depth_stats.add(ds, sample if depth_detail else None)
+        stats = depth_stats.result(depth_detail)
+    except Exception as e:
+        print(f"Failed to compute depth statistics: {e}")
+        stats = None
+    return {"summary": sample_records, "total": total_count, "depth_stats": stats}
+
+
+def _with_pressure(columns: Optional[List[str]]) -> Optional[List[str]]:
+    # PRES is always read so that depth statistics can be binned
+    if columns is None or "PRES" in columns:
+        return columns
+    return columns + ["PRES"]
+
+
+def estimate_region_bytes(box: Dict[str, float], date_start: str, date_end: str) -> int:
+    """Rough in-memory size of the raw rows of a region fetch."""
+    index = coverage_service.index
+    if index is not None:
+        profiles = index.count(box, date_start, date_end)
+    else:
+        n_lon = math.ceil(box["lon_max"] / ARGO_TILE_DEG) - math.floor(box["lon_min"] / ARGO_TILE_DEG)
+        n_lat = math.ceil(box["lat_max"] / ARGO_TILE_DEG) - math.floor(box["lat_min"] / ARGO_TILE_DEG)
+        months = len(_months_in_range(date_start, date_end))
+        profiles = max(n_lon, 1) * max(n_lat, 1) * months * ARGO_PROFILES_PER_TILE_MONTH
+    return int(profiles * ARGO_LEVELS_PER_PROFILE * ARGO_BYTES_PER_ROW)
+
+
+def _split_box(box: Dict[str, float]) -> List[Dict[str, float]]:
+    """Halve a box across its longer side."""
+    if box["lon_max"] - box["lon_min"] >= box["lat_max"] - box["lat_min"]:
+        mid = (box["lon_min"] + box["lon_max"]) / 2
+        return [{**box, "lon_max": mid}, {**box, "lon_min": mid}]
+    mid = (box["lat_min"] + box["lat_max"]) / 2
+    return [{**box, "lat_max": mid}, {**box, "lat_min": mid}]
+
+
+def plan_region_chunks(
+    box: Dict[str, float], date_start: str, date_end: str, max_bytes: int
+) -> List[tuple]:
+    """Split a region into (box, date_start, date_end) chunks of at most ``max_bytes``.
+
+    The range is cut into calendar months first, then each month's box is
+    halved until its estimate fits or it is down to a single tile.
+    """
+    chunks = []
+
+    def plan(part: Dict[str, float], start: str, end: str) -> None:
+        side = max(part["lon_max"] - part["lon_min"], part["lat_max"] - part["lat_min"])
+        if side > ARGO_TILE_DEG and estimate_region_bytes(part, start, end) > max_bytes:
+            for half in _split_box(part):
+                plan(half, start, end)
+        else:
+            chunks.append((part, start, end))
+
+    for month in _months_in_range(date_start, date_end):
+        plan(box, max(month.isoformat(), date_start), min(_month_end(month).isoformat(), date_end))
+    return chunks
+
+
+def summarize_region_chunked(
+    box: Dict[str, float],
+    date_start: str,
+    date_end: str,
+    columns: Optional[List[str]] = None,
+    target: int = ARGO_SAMPLE_SIZE,
+    max_bytes: int = ARGO_FETCH_MAX_BYTES,
+    depth_detail: bool = False,
+) -> Dict[str, Any]:
+    """Same result as ``summarize_dataframe`` without holding the whole region.
+
+    Each chunk's raw rows are folded into the depth statistics, thinned to
+    ``target`` grid-sampled candidates for a ProfileReservoir and dropped. The
+    final sample is drawn from the reservoir with ``sample_profiles``. Tile
+    frames and their concatenation are both resident while a chunk is
+    filtered, hence chunks of half the limit.
+    """
+    chunks = plan_region_chunks(box, date_start, date_end, max_bytes // 2)
+    print(f"Fetching region in {len(chunks)} chunks")
+    depth_stats = DepthBinAccumulator()
+    reservoir = ProfileReservoir(max(target, ARGO_FETCH_RESERVOIR))
+    total = 0
+    for i, (chunk_box, chunk_start, chunk_end) in enumerate(chunks):
+        try:
+            ds = fetch_region_dataframe(
+                chunk_box, chunk_start, chunk_end, _with_pressure(columns)
+            )
+        except FileNotFoundError:
+            continue
+        total += len(ds)
+        candidates = sample_profiles(ds, target, ARGO_SAMPLE_SEED + i)
+        depth_stats.add(ds, candidates if depth_detail else None)
+        del ds
+        reservoir.add(candidates)
+        depth_stats.keep_profiles(reservoir.frame)
+
+    if reservoir.frame is None:
+        raise FileNotFoundError("No Argo data found for the requested region")
+    sample = sample_profiles(reservoir.frame, target)
+    depth_stats.keep_profiles(sample)
+    return {
+        "summary": dataframe_to_records(_select_columns(sample, columns)),
+        "total": total,
+        "depth_stats": depth_stats.result(depth_detail),
+    }
+
+
+def plan_box_fetch(box: Dict[str, float], date_start: str, date_end: str) -> List[tuple]:
+    """The (box, date_start, date_end) reads ``fetch_argopy_for_box`` makes for a region.
+
+    The prefetcher warms exactly these, so it fills the same cache entries
+    (tiles or a whole-box key) that requests read.
+    """
+    if estimate_region_bytes(box, date_start, date_end) > ARGO_FETCH_MAX_BYTES:
+        return plan_region_chunks(box, date_start, date_end, ARGO_FETCH_MAX_BYTES // 2)
+    return [(box, date_start, date_end)]
+
+
+def fetch_argopy_for_box(
+    box: Dict[str, float],
+    date_min: Optional[str] = None,
+    date_max: Optional[str] = None,
+    variables: Optional[List[str]] = None,
+    depth_detail: bool = False,
+) -> Dict[str, Any]:
+    date_min, date_max = normalize_date_range(date_min, date_max)
+    columns = columns_for_variables(variables)
+    misses = argo_cache.thread_misses()
+    try:
+        chunks = plan_box_fetch(box, date_min, date_max)
+        if len(chunks) > 1:
+            return summarize_region_chunked(
+                box, date_min, date_max, columns, depth_detail=depth_detail
+            )
+        ds = fetch_region_dataframe(box, date_min, date_max, _with_pressure(columns))
+        return summarize_dataframe(ds, columns=columns, depth_detail=depth_detail)
+    finally:
+        if data_source.cacheable:
+            prefetch_scheduler.record_request(argo_cache.thread_misses() == misses)
+
+
+def _group_points(points: List[Dict[str, float]]) -> List[List[int]]:
+    """Greedily merge nearby points into groups fetched with one enclosing region.
+
+    A point joins the first group whose extent stays within
+    ARGO_POINT_GROUP_DEG in both longitude and latitude once it is added.
+    """
+    groups: List[Dict[str, Any]] = []
+    order = sorted(range(len(points)), key=lambda i: (points[i]["lon"], points[i]["lat"]))
+    for i in order:
+        lon, lat = points[i]["lon"], points[i]["lat"]
+        for group in groups:
+            lon_min, lon_max = min(group["lon_min"], lon), max(group["lon_max"], lon)
+            lat_min, lat_max = min(group["lat_min"], lat), max(group["lat_max"], lat)
+            if (
+                lon_max - lon_min <= ARGO_POINT_GROUP_DEG
+                and lat_max - lat_min <= ARGO_POINT_GROUP_DEG
+            ):
+                group.update(
+                    lon_min=lon_min, lon_max=lon_max, lat_min=lat_min, lat_max=lat_max
+                )
+                group["members"].append(i)
+                break
+        else:
+            groups.append(
+                {
+                    "lon_min": lon,
+                    "lon_max": lon,
+                    "lat_min": lat,
+                    "lat_max": lat,
+                    "members": [i],
+                }
+            )
+    return [group["members"] for group in groups]
+
+
+def _fetch_point_group(
+    points: List[Dict[str, float]],
+    date_min: str,
+    date_max: str,
+    columns: Optional[List[str]] = None,
+    depth_detail: bool = False,
+) -> List[Dict[str, Any]]:
+    """Fetch one enclosing region for ``points`` and split its rows back per point."""
+    r = ARGO_POINT_RADIUS_DEG
+    box = {
+        "lon_min": min(p["lon"] for p in points) - r,
+        "lon_max": max(p["lon"] for p in points) + r,
+        "lat_min": min(p["lat"] for p in points) - r,
+        "lat_max": max(p["lat"] for p in points) + r,
+    }
+    try:
+        ds = fetch_region_dataframe(
+            box, date_min, date_max, _with_pressure(columns)
+        )
+    except Exception as exc:
+        return [{"point": p, "error": str(exc)} for p in points]
+
+    lon = ds["LONGITUDE"].to_numpy()
+    lat = ds["LATITUDE"].to_numpy()
+    summaries = []
+    for p in points:
+        mask = (
+            (lon >= p["lon"] - r)
+            & (lon <= p["lon"] + r)
+            & (lat >= p["lat"] - r)
+            & (lat <= p["lat"] + r)
+        )
+        if not mask.any():
+            summaries.append(
+                {"point": p, "error": "No Argo data found for the requested region"}
+            )
+            continue
+        try:
+            res = summarize_dataframe(
+                ds[mask], columns=columns, depth_detail=depth_detail
+            )
+            summaries.append(
+                {
+                    "point": p,
+                    "summary": res.get("summary"),
+                    "total": res.get("total"),
+                    "depth_stats": res.get("depth_stats"),
+                }
+            )
+        except Exception as exc:
+            summaries.append({"point": p, "error": str(exc)})
+    return summaries
+
+
+def iter_point_summaries(
+    points: List[Dict[str, float]],
+    date_min: Optional[str] = None,
+    date_max: Optional[str] = None,
+    variables: Optional[List[str]] = None,
+    depth_detail: bool = False,
+):
+    """Yield ``[(point index, summary), ...]`` for each point group as it completes."""
+    date_min, date_max = normalize_date_range(date_min, date_max)
+    columns = columns_for_variables(variables)
+    groups = _group_points(points)
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(ARGO_POINTS_MAX_WORKERS, len(groups)))
+    ) as pool:
+        futures = {
+            pool.submit(
+                _fetch_point_group,
+                [points[i] for i in members],
+                date_min,
+                date_max,
+                columns,
+                depth_detail,
+            ): members
+            for members in groups
+        }
+        for future in as_completed(futures):
+            yield list(zip(futures[future], future.result()))
+
+
+def fetch_argopy_for_points(
+    points: List[Dict[str, float]],
+    date_min: Optional[str] = None,
+    date_max: Optional[str] = None,
+    variables: Optional[List[str]] = None,
+    depth_detail: bool = False,
+) -> Dict[str, Any]:
+    summaries: List[Optional[Dict[str, Any]]] = [None] * len(points)
+    for chunk in iter_point_summaries(
+        points, date_min, date_max, variables, depth_detail
+    ):
+        for i, summary in chunk:
+            summaries[i] = summary
+    return {"summaries": summaries}
+
+
+def iter_box_chunks(
+    box: Dict[str, float],
+    date_min: Optional[str] = None,
+    date_max: Optional[str] = None,
+    variables: Optional[List[str]] = None,
+):
+    """Yield box results chunk by chunk, as soon as each chunk's tiles are resident.
+
+    Chunks come from ``plan_region_chunks``: one per month, with the months of
+    large boxes split further so no chunk exceeds ARGO_FETCH_MAX_BYTES. Each
+    is sampled to an even share of what is left of ARGO_SAMPLE_SIZE, so
+    sparse chunks hand their unused share on and the total never exceeds it;
+    chunks without any profile are skipped. ``depth_stats`` in each chunk
+    covers all chunks so far.
+    """
+    date_min, date_max = normalize_date_range(date_min, date_max)
+    columns = columns_for_variables(variables)
+    chunks = plan_region_chunks(box, date_min, date_max, ARGO_FETCH_MAX_BYTES // 2)
+    remaining = ARGO_SAMPLE_SIZE
+    depth_stats = DepthBinAccumulator()
+    for i, (chunk_box, chunk_start, chunk_end) in enumerate(chunks):
+        try:
+            ds = fetch_region_dataframe(
+                chunk_box, chunk_start, chunk_end, _with_pressure(columns)
+            )
+        except FileNotFoundError:
+            continue
+        result = summarize_dataframe(
+            ds, math.ceil(remaining / (len(chunks) - i)), columns, depth_stats
+        )
+        remaining -= len(result["summary"])
+        yield result
+
+
+# --- Helper: single-flight deduplication of in-flight fetches ---
+class SingleFlight:
+    """Share one in-flight executor call between concurrent callers with the same key.
+
+    The first caller for a key starts the work on the default executor; callers
+    arriving before it finishes await the same future instead of starting a
+    duplicate download.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self._waiters: Dict[Any, int] = {}
+        self.calls = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+
+    async def run(self, key: Any, fn, *args) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            self.calls += 1
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, fn, *args)
+            self._inflight[key] = future
+            future.add_done_callback(
+                lambda done: self._inflight.pop(key, None)
+                if self._inflight.get(key) is done
+                else None
+            )
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # Shield so one caller disconnecting doesn't cancel the shared fetch
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def cancel(self, key: Any) -> bool:
+        """Drop the in-flight call for ``key`` if no caller is waiting for it.
+
+        A call still queued for the executor never starts; one already running
+        finishes in its thread but its result is discarded.
+        """
+        future = self._inflight.get(key)
+        if future is None or self._waiters.get(key):
+            return False
+        future.cancel()
+        self._inflight.pop(key, None)
+        self.cancelled += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._inflight),
+        }
+
+
+fetch_single_flight = SingleFlight()
+
+
+def box_flight_key(
+    box: Dict[str, float],
+    date_min: Optional[str],
+    date_max: Optional[str],
+    variables: Optional[List[str]] = None,
+    depth_detail: bool = False,
+) -> tuple:
+    date_start, date_end = normalize_date_range(date_min, date_max)
+    return (
+        "box",
+        argo_cache.make_key(box, date_start, date_end),
+        tuple(columns_for_variables(variables) or ()),
+        depth_detail,
+    )
+
+
+async def fetch_box_shared(
+    box: Dict[str, float],
+    date_min: Optional[str],
+    date_max: Optional[str],
+    variables: Optional[List[str]] = None,
+    depth_detail: bool = False,
+) -> Dict[str, Any]:
+    key = box_flight_key(box, date_min, date_max, variables, depth_detail)
+    return await fetch_single_flight.run(
+        key, fetch_argopy_for_box, box, date_min, date_max, variables, depth_detail
+    )
+
+
+async def fetch_points_shared(
+    points: List[Dict[str, float]],
+    date_min: Optional[str],
+    date_max: Optional[str],
+    variables: Optional[List[str]] = None,
+    depth_detail: bool = False,
+) -> Dict[str, Any]:
+    date_start, date_end = normalize_date_range(date_min, date_max)
+    key = (
+        "points",
+        tuple((round(p["lat"], 4), round(p["lon"], 4)) for p in points),
+        date_start,
+        date_end,
+        tuple(columns_for_variables(variables) or ()),
+        depth_detail,
+    )
+    return await fetch_single_flight.run(
+        key, fetch_argopy_for_points, points, date_min, date_max, variables, depth_detail
+    )
+
+
+def climatology_result(
+    box: Dict[str, float],
+    date_min: Optional[str],
+    date_max: Optional[str],
+    variables: Optional[List[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Answer an aggregate box query from the climatology cube, if it can.
+
+    The cube is indexed by calendar month, so the requested range only picks
+    the months of the year to average over. Returns None when there is no
+    cube, the box lies outside it, or it holds no data there.
+    """
+    if climatology_cube is None or not climatology_cube.covers(box):
+        return None
+    date_start, date_end = normalize_date_range(date_min, date_max)
+    months = {m.month for m in _months_in_range(date_start, date_end)}
+    columns = columns_for_variables(variables) or DEPTH_STAT_VARIABLES
+    stats = climatology_cube.aggregate(
+        box, sorted(months), [c for c in DEPTH_STAT_VARIABLES if c in columns]
+    )
+    if stats is None:
+        return None
+    # Like fetched results, only the region-wide bins are sent
+    stats.pop("cells", None)
+    total = max(sum(v["count"]) for v in stats["overall"].values())
+    return {"summary": [], "total": total, "depth_stats": stats}
+
+
+# --- Helper: hedged fetch of the original and broadened box ---
+# Errors after which the broadened box is worth trying
+BOX_FALLBACK_ERRORS = (
+    FileNotFoundError,
+    FSTimeoutError,
+    asyncio.TimeoutError,
+    aiohttp.ClientError,
+)
+
+
+def broaden_box(box: Dict[str, float], margin: float = ARGO_BROADER_BOX_DEG) -> Dict[str, float]:
+    return {
+        "lon_min": max(-180, box["lon_min"] - margin),
+        "lon_max": min(180, box["lon_max"] + margin),
+        "lat_min": max(-90, box["lat_min"] - margin),
+        "lat_max": min(90, box["lat_max"] + margin),
+    }
+
+
+class HedgedBoxFetch:
+    """Fetch a box, racing it against a broadened box when it is slow.
+
+    The original box gets ``delay`` seconds on its own. If it fails by then
+    the broadened box is fetched as before; if it is still running, the
+    broadened fetch starts alongside it and the first successful result wins.
+    The loser's task is cancelled (shared fetches keep running in the
+    background and still fill the cache). ``delay=None`` disables hedging and
+    falls back serially, which streaming requests need since their chunks are
+    sent as they arrive.
+    """
+
+    def __init__(self):
+        self.counts = {"original": 0, "broader": 0, "hedged": 0, "failed": 0}
+
+    async def run(
+        self, fetch_box, box: Dict[str, float], delay: Optional[float] = ARGO_HEDGE_DELAY
+    ) -> tuple:
+        """Return ``(result, box used, path)`` with path "original" or "broader"."""
+        broader_box = broaden_box(box)
+        original = asyncio.create_task(fetch_box(box))
+        broader = None
+        try:
+            done, _ = await asyncio.wait({original}, timeout=delay)
+            if done:
+                try:
+                    return self._won(original.result(), box, "original")
+                except BOX_FALLBACK_ERRORS:
+                    print("Original box failed, trying broader area...")
+                    return self._won(await fetch_box(broader_box), broader_box, "broader")
+
+            print(f"Original box still running after {delay}s, hedging with broader area...")
+            self.counts["hedged"] += 1
+            broader = asyncio.create_task(fetch_box(broader_box))
+            pending = {original, broader}
+            first_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer the original box if both finished together
+                for task in sorted(done, key=lambda t: t is not original):
+                    error = task.exception()
+                    if error is None:
+                        for loser in pending:
+                            loser.cancel()
+                        if task is original:
+                            return self._won(task.result(), box, "original")
+                        return self._won(task.result(), broader_box, "broader")
+                    if not isinstance(error, BOX_FALLBACK_ERRORS):
+                        raise error
+                    if task is original or first_error is None:
+                        first_error = error
+            raise first_error
+        except BaseException:
+            self.counts["failed"] += 1
+            for task in (original, broader):
+                if task is not None:
+                    task.cancel()
+            raise
+
+    def _won(self, result: Dict[str, Any], box: Dict[str, float], path: str) -> tuple:
+        self.counts[path] += 1
+        return result, box, path
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counts)
+
+
+hedged_box_fetch = HedgedBoxFetch()
+
+
+# --- Helper: coverage-guided box selection ---
+class CoverageService:
+    """Keeps a CoverageIndex of the data source fresh and plans box fetches.
+
+    The index is built in the background at startup and every ``refresh``
+    seconds; until it exists (or when a source can't list its profiles) every
+    plan is None and requests fall back to the hedged fetch. With
+    ARGO_COVERAGE_ENABLED=0 (the default for the argopy source) the index is
+    never built.
+    """
+
+    def __init__(
+        self, enabled: bool = ARGO_COVERAGE_ENABLED, refresh: int = ARGO_COVERAGE_REFRESH
+    ):
+        self.enabled = enabled
+        self.refresh = refresh
+        self.index: Optional[CoverageIndex] = None
+        self.counts = {"planned": 0, "empty": 0, "expanded": 0, "missed": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def build(self) -> None:
+        started = time.time()
+        self.index = CoverageIndex(data_source.profile_positions())
+        print(
+            f"Built coverage index of {self.index.profiles} profiles "
+            f"in {time.time() - started:.1f}s"
+        )
+
+    async def refresh_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.build)
+            except NotImplementedError:
+                return
+            except Exception as e:
+                print(f"Failed to build coverage index: {e}")
+            await asyncio.sleep(self.refresh)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self.refresh_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def plan_box(
+        self,
+        box: Dict[str, float],
+        date_min: Optional[str],
+        date_max: Optional[str],
+        record: bool = True,
+    ) -> Optional[Dict[str, Any]]:
+        """The box to fetch (None if the region is empty), or None if unknown."""
+        date_start, date_end = normalize_date_range(date_min, date_max)
+        if self.index is None or not self.index.covers(date_end):
+            return None
+        plan = self.index.expand(box, date_start, date_end)
+        if not record:
+            return plan
+        self.counts["planned"] += 1
+        if plan["box"] is None:
+            self.counts["empty"] += 1
+        elif plan["margin"] > 0:
+            self.counts["expanded"] += 1
+        return plan
+
+    def points_empty(
+        self,
+        points: List[Dict[str, float]],
+        date_min: Optional[str],
+        date_max: Optional[str],
+    ) -> bool:
+        """True only if the index is sure no point has any profile nearby."""
+        date_start, date_end = normalize_date_range(date_min, date_max)
+        if self.index is None or not self.index.covers(date_end):
+            return False
+        r = ARGO_POINT_RADIUS_DEG
+        for p in points:
+            box = {
+                "lon_min": p["lon"] - r,
+                "lon_max": p["lon"] + r,
+                "lat_min": p["lat"] - r,
+                "lat_max": p["lat"] + r,
+            }
+            if self.index.count(box, date_start, date_end) > 0:
+                return False
+        self.counts["empty"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self.counts,
+            "index": self.index.stats() if self.index is not None else None,
+        }
+
+
+coverage_service = CoverageService()
+
+
+# --- Helper: warm-up and prefetch of popular regions ---
+class PrefetchScheduler:
+    """Keeps the most requested box regions warm in the Argo cache.
+
+    Popular regions are counted from the ``query_meta`` of past chats in
+    Chroma and fetched at startup and every ``interval`` seconds, at most
+    ``concurrency`` at a time and within ``budget`` seconds per run. The hit
+    rate counts box fetches on the request path that found every cache entry
+    they read already present.
+    """
+
+    def __init__(
+        self,
+        interval: int = ARGO_PREFETCH_INTERVAL,
+        top_n: int = ARGO_PREFETCH_TOP_N,
+        concurrency: int = ARGO_PREFETCH_CONCURRENCY,
+        budget: int = ARGO_PREFETCH_BUDGET,
+    ):
+        self.interval = interval
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.budget = budget
+        self.prefetched: Dict[str, float] = {}
+        self.requests = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _region_key(
+        box: Dict[str, float], date_min: Optional[str], date_max: Optional[str]
+    ) -> str:
+        date_start, date_end = normalize_date_range(date_min, date_max)
+        return argo_cache.make_key(box, date_start, date_end)
+
+    def popular_regions(self) -> List[tuple]:
+        """Most requested (box, date_min, date_max) in the recent chat history."""
+        counts: Dict[str, int] = {}
+        regions: Dict[str, tuple] = {}
+        try:
+            # Chroma returns records in insertion order, so read the metadata
+            # and keep the newest chats rather than asking for a limit
+            history = chat_embeddings_collection.get(include=["metadatas"])
+            metadatas = history.get("metadatas") or []
+        except Exception as e:
+            print(f"Failed to read chat history for prefetch: {e}")
+            metadatas = []
+        metadatas = sorted(
+            (m for m in metadatas if m),
+            key=lambda m: str(m.get("timestamp") or ""),
+            reverse=True,
+        )[:ARGO_PREFETCH_HISTORY]
+        for metadata in metadatas:
+            try:
+                meta = json.loads(metadata.get("query_meta") or "{}")
+            except (TypeError, ValueError):
+                continue
+            # Count the box users asked for, not the one coverage widened
+            box = meta.get("requested_box") or meta.get("box")
+            if meta.get("mode") != "box" or not box:
+                continue
+            region = (
+                box,
+                meta.get("date_min_provided"),
+                meta.get("date_max_provided"),
+            )
+            key = self._region_key(*region)
+            counts[key] = counts.get(key, 0) + 1
+            regions[key] = region
+        popular = sorted(counts, key=counts.get, reverse=True)[: self.top_n]
+        selected = [regions[key] for key in popular]
+        for box in DEFAULT_PREFETCH_REGIONS:
+            if len(selected) >= self.top_n:
+                break
+            if self._region_key(box, None, None) not in counts:
+                selected.append((box, None, None))
+        return selected
+
+    def _prefetch(
+        self,
+        box: Dict[str, float],
+        date_min: Optional[str],
+        date_max: Optional[str],
+        deadline: float,
+    ) -> bool:
+        """Warm the cache entries a request for the region reads; False if out of time.
+
+        Like a request, the box is first widened by the coverage plan; the
+        reads then follow ``plan_box_fetch`` and only read back the
+        coordinates. The deadline is checked between chunks, since a fetch
+        already running on the executor can't be cancelled.
+        """
+        plan = coverage_service.plan_box(box, date_min, date_max, record=False)
+        if plan is not None:
+            if plan["box"] is None:
+                return True
+            box = plan["box"]
+        date_start, date_end = normalize_date_range(date_min, date_max)
+        for chunk in plan_box_fetch(box, date_start, date_end):
+            if time.time() > deadline:
+                return False
+            try:
+                fetch_region_dataframe(*chunk, columns=COORDINATE_COLUMNS)
+            except FileNotFoundError:
+                pass
+        return True
+
+    async def run_once(self) -> Dict[str, Any]:
+        started = time.time()
+        loop = asyncio.get_running_loop()
+        regions = await loop.run_in_executor(None, self.popular_regions)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        deadline = started + self.budget
+        cut_short = 0
+
+        async def prefetch(region):
+            nonlocal cut_short
+            async with semaphore:
+                key = self._region_key(*region)
+                finished = await fetch_single_flight.run(
+                    ("prefetch", key), self._prefetch, *region, deadline
+                )
+                if finished:
+                    self.prefetched[key] = time.time()
+                else:
+                    cut_short += 1
+
+        tasks = [asyncio.create_task(prefetch(region)) for region in regions]
+        done, pending = await asyncio.wait(tasks, timeout=self.budget) if tasks else ((), ())
+        for task in pending:
+            task.cancel()
+        failed = [t for t in done if t.exception() is not None]
+        for task in failed:
+            print(f"Prefetch failed: {task.exception()}")
+        self.last_run = {
+            "regions": len(regions),
+            "completed": len(done) - len(failed) - cut_short,
+            "failed": len(failed),
+            "timed_out": len(pending) + cut_short,
+            "seconds": round(time.time() - started, 2),
+        }
+        print(f"Prefetch run: {self.last_run}")
+        return self.last_run
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Prefetch run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        # Prefetching only helps sources that go through the on-disk cache
+        if ARGO_PREFETCH_ENABLED and data_source.cacheable and self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def record_request(self, served_from_cache: bool) -> None:
+        # Called from the fetch threads
+        with self._lock:
+            self.requests += 1
+            if served_from_cache:
+                self.hits += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.requests, 3) if self.requests else None,
+            "regions_prefetched": len(self.prefetched),
+            "last_run": self.last_run,
+        }
+
+
+prefetch_scheduler = PrefetchScheduler()
+
+
+async def fetch_full_columns(query_meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Re-fetch an earlier query with every column, for the variable toggle.
+
+    This always takes the non-streaming fetch path, so it is a new sample rather
+    than the original rows: a streamed result was sampled per chunk, and a
+    result answered from the climatology cube had no profiles at all. The
+    tiles are usually cached, so it is cheap. Unlike the first result it
+    carries the per-cell and per-profile depth statistics.
+    """
+    date_min = query_meta.get("date_min_provided")
+    date_max = query_meta.get("date_max_provided")
+    if query_meta.get("mode") == "box" and query_meta.get("box"):
+        return await fetch_box_shared(
+            query_meta["box"], date_min, date_max, depth_detail=True
+        )
+    if query_meta.get("mode") == "points" and query_meta.get("points"):
+        return await fetch_points_shared(
+            query_meta["points"], date_min, date_max, depth_detail=True
+        )
+    raise ValueError("query_meta must contain a box or points to re-fetch")
+
+
+# --- Helper: compact columnar binary frames for result payloads ---
+# Frame layout ("columnar-v1"):
+#   uint32 big-endian header length | UTF-8 JSON header, space-padded so the
+#   body starts on an 8-byte boundary | body of column buffers, each 8-byte aligned
+# Record lists under "summary" keys are replaced in the header by
+#   {"columnar": {"rows": n, "columns": [{"name", "type", ...}]}}
+# where numeric columns point into the body ("offset"/"length" in bytes,
+# little-endian) and other columns carry their "values" inline.
+WIRE_FORMATS = ["columnar-v1", "json"]
+_ISO_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$")
+
+
+def _encode_column(values: List[Any], body: bytearray) -> Dict[str, Any]:
+    present = [v for v in values if v is not None]
+
+    def append(array: np.ndarray) -> Dict[str, Any]:
+        body.extend(b"\0" * (-len(body) % 8))
+        offset = len(body)
+        body.extend(array.astype(array.dtype.newbyteorder("<")).tobytes())
+        return {"offset": offset, "length": len(body) - offset}
+
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        if len(present) == len(values) and all(-(2**31) <= v < 2**31 for v in present):
+            return {"type": "int32", **append(np.array(values, dtype="int32"))}
+        array = np.array([np.nan if v is None else v for v in values], dtype="float64")
+        return {"type": "float64", **append(array)}
+    if present and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in present
+    ):
+        array = np.array([np.nan if v is None else v for v in values], dtype="float32")
+        return {"type": "float32", **append(array)}
+    if present and all(
+        isinstance(v, str) and _ISO_TIMESTAMP.match(v) for v in present
+    ):
+        # Seconds since the epoch, NaN for missing values
+        stamps = np.array(
+            [np.datetime64("NaT") if v is None else v for v in values],
+            dtype="datetime64[s]",
+        )
+        array = np.where(np.isnat(stamps), np.nan, stamps.astype("int64"))
+        return {"type": "timestamp_s", **append(array.astype("float64"))}
+    return {"type": "json", "values": values}
+
+
+def _columnarize(obj: Any, body: bytearray) -> Any:
+    if isinstance(obj, dict):
+        out = {}
+        for key, value in obj.items():
+            if (
+                key == "summary"
+                and isinstance(value, list)
+                and value
+                and all(isinstance(row, dict) for row in value)
+            ):
+                names = list(dict.fromkeys(k for row in value for k in row))
+                columns = [
+                    {"name": name, **_encode_column([row.get(name) for row in value], body)}
+                    for name in names
+                ]
+                out[key] = {"columnar": {"rows": len(value), "columns": columns}}
+            else:
+                out[key] = _columnarize(value, body)
+        return out
+    if isinstance(obj, list):
+        return [_columnarize(item, body) for item in obj]
+    return obj
+
+
+def encode_columnar_frame(message: Dict[str, Any]) -> bytes:
+    """Encode a message as a columnar-v1 binary frame (see layout above)."""
+    body = bytearray()
+    header = json.dumps(
+        _columnarize(message, body), default=str, allow_nan=False
+    ).encode("utf-8")
+    header += b" " * (-(4 + len(header)) % 8)
+    return len(header).to_bytes(4, "big") + header + bytes(body)
+
+
+async def send_payload(ws: WebSocket, message: Dict[str, Any], wire_format: str) -> None:
+    """Send a data-carrying message in the wire format negotiated by the client."""
+    if wire_format == "columnar-v1":
+        await ws.send_bytes(encode_columnar_frame(message))
+    else:
+        await ws.send_text(json.dumps(message, default=str, allow_nan=False))
+
+
+# --- Helper: streaming results to the client chunk by chunk ---
+async def iterate_in_executor(gen_fn, *args, max_pending: int = 2):
+    """Run a blocking generator on the default executor and yield its items here.
+
+    At most ``max_pending`` items wait in the queue: the generator is paused
+    while the consumer (usually a slow websocket) catches up. When the
+    consumer stops early the generator is closed before its next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(message) -> bool:
+        # Block until there is room, unless the consumer has gone away
+        future = asyncio.run_coroutine_threadsafe(queue.put(message), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    def produce():
+        gen = gen_fn(*args)
+        try:
+            for item in gen:
+                if stop.is_set() or not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as exc:
+            put(("error", exc))
+        finally:
+            gen.close()
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                await producer
+                raise value
+            else:
+                await producer
+                return
+    finally:
+        stop.set()
+
+
+async def stream_region_result(
+    ws: WebSocket,
+    request_id: str,
+    mode: str,
+    target: Any,
+    date_min: Optional[str],
+    date_max: Optional[str],
+    variables: Optional[List[str]] = None,
+    wire_format: str = "json",
+) -> Dict[str, Any]:
+    """Send a select_region result as ``data_chunk`` messages while it is fetched.
+
+    Box results arrive month by month and points results group by group. The
+    accumulated records are returned for the analysis stages; the full
+    serialized payload is never built. Raises FileNotFoundError, before any
+    chunk is sent, if a box has no data at all.
+    """
+    if mode == "box":
+        chunks = iterate_in_executor(
+            iter_box_chunks, target, date_min, date_max, variables
+        )
+    else:
+        chunks = iterate_in_executor(
+            iter_point_summaries, target, date_min, date_max, variables
+        )
+
+    seq = 0
+    summary: List[Dict[str, Any]] = []
+    total = 0
+    depth_stats = None
+    summaries: List[Optional[Dict[str, Any]]] = [None] * (
+        len(target) if mode == "points" else 0
+    )
+    try:
+        async for chunk in chunks:
+            message: Dict[str, Any] = {
+                "stage": "data_chunk",
+                "request_id": request_id,
+                "seq": seq,
+            }
+            if mode == "box":
+                summary.extend(chunk["summary"])
+                total += chunk["total"] or 0
+                # Cumulative over the chunks so far; sent once with data_done
+                depth_stats = chunk.get("depth_stats")
+                message.update(summary=chunk["summary"], total=chunk["total"])
+            else:
+                for i, item in chunk:
+                    summaries[i] = item
+                message["summaries"] = [{"index": i, **item} for i, item in chunk]
+            await send_payload(ws, message, wire_format)
+            seq += 1
+    finally:
+        # Stops the fetch if the client went away or a send failed
+        await chunks.aclose()
+
+    if mode == "box":
+        if not summary:
+            raise FileNotFoundError("No Argo data found for the requested region")
+        return {
+            "summary": summary,
+            "total": total,
+            "depth_stats": depth_stats,
+            "chunks": seq,
+        }
+    return {"summaries": summaries, "chunks": seq}
+
+
+# --- Helper: speculative fetch of the predicted region ---
+class SpeculativeFetch:
+    """Start fetching the region a query will probably ask for while Gemini decides.
+
+    The guess is the box of the previous turn in the session (follow-ups like
+    "now show salinity there" keep it) or else the box of the most similar
+    earlier chat. When the selected region turns out the same, the real fetch
+    awaits the speculative one instead of starting its own. A wrong guess is
+    cancelled.
+    """
+
+    def __init__(self, enabled: bool = ARGO_SPECULATE_ENABLED):
+        self.enabled = enabled
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def predict(
+        last_query_meta: Optional[Dict[str, Any]], similar_chats: List[Dict]
+    ) -> Optional[Dict[str, Any]]:
+        candidates = [last_query_meta]
+        for chat in similar_chats[:1]:
+            try:
+                candidates.append(json.loads(chat.get("query_meta") or "{}"))
+            except (TypeError, ValueError):
+                pass
+        for meta in candidates:
+            if not meta or meta.get("mode") != "box" or meta.get("source") == "climatology":
+                continue
+            box = meta.get("requested_box") or meta.get("box")
+            if box:
+                return {
+                    "box": box,
+                    "date_min": meta.get("date_min_provided"),
+                    "date_max": meta.get("date_max_provided"),
+                    "variables": meta.get("selected_variables") or [],
+                }
+        return None
+
+    def start(
+        self, last_query_meta: Optional[Dict[str, Any]], similar_chats: List[Dict]
+    ) -> Optional[Dict[str, Any]]:
+        """Start fetching the predicted region; returns the guess to resolve later."""
+        if not self.enabled:
+            return None
+        guess = self.predict(last_query_meta, similar_chats)
+        if guess is None:
+            return None
+        date_min, date_max = guess["date_min"], guess["date_max"]
+        # Fetch what the real request would fetch for this box
+        plan = coverage_service.plan_box(guess["box"], date_min, date_max)
+        if plan is not None and plan["box"] is None:
+            return None
+        box = plan["box"] if plan is not None else guess["box"]
+        guess["key"] = box_flight_key(box, date_min, date_max, guess["variables"])
+        guess["task"] = asyncio.create_task(
+            fetch_box_shared(box, date_min, date_max, guess["variables"])
+        )
+        # Nobody may await a wrong guess; keep its errors out of the log
+        guess["task"].add_done_callback(
+            lambda task: task.cancelled() or task.exception()
+        )
+        self.started += 1
+        print(f"Speculatively fetching {box} from {date_min} to {date_max}")
+        return guess
+
+    def resolve(self, guess: Optional[Dict[str, Any]], args: Dict[str, Any]) -> bool:
+        """Compare the guess with Gemini's select_region args; cancel it if wrong."""
+        if guess is None:
+            return False
+        hit = (
+            args.get("mode") == "box"
+            and bool(args.get("box"))
+            and not args.get("aggregate")
+            and box_flight_key(
+                args["box"], args.get("date_min"), args.get("date_max"), args.get("variables", [])
+            )
+            == box_flight_key(
+                guess["box"], guess["date_min"], guess["date_max"], guess["variables"]
+            )
+        )
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            key = guess["key"]
+            guess["task"].cancel()
+            # Once the task has let go of the shared fetch, stop it too
+            guess["task"].add_done_callback(lambda _: fetch_single_flight.cancel(key))
+        return hit
+
+    def stats(self) -> Dict[str, Any]:
+        resolved = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / resolved, 3) if resolved else None,
+        }
+
+
+speculative_fetch = SpeculativeFetch()
+
+# Named-region queries resolved without Gemini (see gazetteer.py)
+region_parser = RegionQueryParser()
+
+
+# --- Helper: per-query stage graph ---
+class StageStats:
+    """Run count, timing and failures of each named stage across queries."""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, status: str, seconds: float) -> None:
+        entry = self._stages.setdefault(
+            name,
+            {"runs": 0, "total_seconds": 0.0, "max_seconds": 0.0, "timeouts": 0, "errors": 0},
+        )
+        entry["runs"] += 1
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        if status == "timeout":
+            entry["timeouts"] += 1
+        elif status == "error":
+            entry["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "runs": entry["runs"],
+                "mean_seconds": round(entry["total_seconds"] / entry["runs"], 3),
+                "max_seconds": round(entry["max_seconds"], 3),
+                "timeouts": entry["timeouts"],
+                "errors": entry["errors"],
+            }
+            for name, entry in self._stages.items()
+        }
+
+
+stage_stats = StageStats()
+# Background stages still running after their query was answered
+_background_stages: set = set()
+
+
+class StageGraph:
+    """A small declarative pipeline of async stages.
+
+    Each stage names the stages it depends on and starts as soon as those have
+    finished, so independent stages overlap. A stage function receives its
+    dependencies' results as keyword arguments and runs under its own timeout
+    (STAGE_TIMEOUTS by default). If a required stage fails, the other stages
+    are cancelled and its exception is raised from ``run``; an optional stage
+    that fails or times out yields ``default`` instead. ``run`` does not wait
+    for background stages.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Awaitable[Any]],
+        deps: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        required: bool = True,
+        default: Any = None,
+        background: bool = False,
+    ) -> None:
+        deps = deps or []
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self._stages[name] = {
+            "fn": fn,
+            "deps": deps,
+            "timeout": timeout if timeout is not None else STAGE_TIMEOUTS.get(name),
+            "required": required,
+            "default": default,
+            "background": background,
+        }
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task], started: float) -> Any:
+        stage = self._stages[name]
+        kwargs = {dep: await tasks[dep] for dep in stage["deps"]}
+        stage_start = time.monotonic()
+        status = "ok"
+        try:
+            return await asyncio.wait_for(stage["fn"](**kwargs), stage["timeout"])
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            if stage["required"]:
+                raise
+            reason = f"timed out after {stage['timeout']:g}s" if status == "timeout" else e
+            print(f"Stage {self.name}/{name} failed: {reason}")
+            return stage["default"]
+        finally:
+            seconds = time.monotonic() - stage_start
+            self.timings[name] = {
+                "start": round(stage_start - started, 3),
+                "seconds": round(seconds, 3),
+                "status": status,
+            }
+            if status != "cancelled":
+                stage_stats.record(name, status, seconds)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        _background_stages.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background stage of {self.name} failed: {task.exception()}")
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every stage; returns the results of the foreground stages."""
+        started = time.monotonic()
+        tasks: Dict[str, asyncio.Task] = {}
+        # Stages can only depend on stages added before them
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(self._run_stage(name, tasks, started))
+        foreground = [name for name, stage in self._stages.items() if not stage["background"]]
+        try:
+            await asyncio.gather(*(tasks[name] for name in foreground))
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            print(f"Stages of {self.name}: {self.describe()}")
+        for name, stage in self._stages.items():
+            if stage["background"]:
+                _background_stages.add(tasks[name])
+                tasks[name].add_done_callback(self._background_done)
+        return {name: tasks[name].result() for name in foreground}
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{name} {t['seconds']:.2f}s"
+            + (f" ({t['status']})" if t["status"] != "ok" else "")
+            for name, t in self.timings.items()
+        )
+
+
+async def handle_query(
+    ws: WebSocket,
+    query: str,
+    conversation_history: List[str],
+    stream: bool,
+    request_id: str,
+    wire_format: str,
+    last_query_meta: Optional[Dict[str, Any]] = None,
+    analysis_deltas: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Answer one chat query: select the region, fetch it, analyze and reply.
+
+    Both halves run as a StageGraph. The similar-chat search and the semantic
+    cache lookup run side by side before region selection, and a speculative
+    fetch of the likely region (see SpeculativeFetch) runs alongside the
+    Gemini call. Simple named-region queries skip both the cache and Gemini
+    (see gazetteer.py). After the fetch,
+    the Gemini analysis and the graph analysis run side by side, and the
+    Chroma writes are left in the background once the reply is sent.
+
+    Returns the query_meta of a select_region answer, for the next turn.
+    """
+    # Stage 1: Analyzing
+    await ws.send_text(
+        json.dumps(
+            {
+                "stage": "analyzing",
+                "message": "🔎 Analyzing your query",
+                "thinking": [
+                    "Understanding the ocean data request",
+                    "Searching for similar previous queries",  # Add this line
+                    "Identifying geographical parameters",
+                    "Determining time range requirements",
+                    "Selecting relevant ocean variables",
+                    "Validating query parameters",
+                    "Preparing for AI processing",
+                ],
+            }
+        )
+    )
+    loop = asyncio.get_running_loop()
+
+    # Simple named-region queries need neither the cache nor Gemini
+    parsed_args = region_parser.parse(query)
+
+    # Search for similar chats before calling Gemini
+    async def find_similar_chats() -> List[Dict]:
+        return await loop.run_in_executor(None, search_similar_chats, query, 3, 0.7)
+
+    async def lookup_region_cache() -> Optional[Dict[str, Any]]:
+        if parsed_args is not None:
+            return None
+        return await loop.run_in_executor(
+            None, semantic_region_cache.lookup, query, conversation_history
+        )
+
+    async def select_region(similar_chats, region_cache) -> Dict[str, Any]:
+        if parsed_args is not None:
+            return {"function_call": {"name": "select_region", "args": parsed_args}}
+        if region_cache is not None:
+            return {"function_call": region_cache}
+        return await gemini_select_region(query, similar_chats, conversation_history)
+
+    # Streamed box results don't go through fetch_box_shared, so they
+    # couldn't join a speculative fetch
+    guess = None
+
+    async def speculate(similar_chats, region_cache) -> None:
+        nonlocal guess
+        if not stream and region_cache is None and parsed_args is None:
+            guess = speculative_fetch.start(last_query_meta, similar_chats)
+
+    selection = StageGraph("selection")
+    selection.add("similar_chats", find_similar_chats, required=False, default=[])
+    selection.add("region_cache", lookup_region_cache, required=False)
+    selection.add("speculate", speculate, deps=["similar_chats", "region_cache"], required=False)
+    selection.add("select_region", select_region, deps=["similar_chats", "region_cache"])
+    try:
+        selected = await selection.run()
+    except Exception as exc:
+        speculative_fetch.resolve(guess, {})
+        await ws.send_text(
+            json.dumps({"stage": "error", "message": f"Gemini call failed: {exc}"})
+        )
+        return None
+    similar_chats = selected["similar_chats"]
+    cached_call = selected["region_cache"]
+    gemini_result = selected["select_region"]
+    print(f"Found {len(similar_chats)} similar previous chats")
+
+    fc = gemini_result.get("function_call") or {}
+    args = fc.get("args", {})
+    speculation = None
+    if speculative_fetch.resolve(guess, args if fc.get("name") == "select_region" else {}):
+        print("Speculative fetch matches the selected region")
+        speculation = guess
+
+    if "function_call" not in gemini_result:
+        text = gemini_result.get("text", "")
+        await ws.send_text(json.dumps({"stage": "no_function_call", "message": text}))
+        return None
+
+    # Stage 2: Generating SQL
+    print(f"Generating SQL for function call: {fc}")
+    await ws.send_text(
+        json.dumps(
+            {
+                "stage": "sql_generation",
+                "message": "🛠 Generating SQL for your request",
+                "thinking": [
+                    "Parsing natural language to structured query",
+                    "Extracting geographical coordinates",
+                    "Building database query parameters",
+                    "Validating query constraints",
+                    "Optimizing query performance",
+                    "Preparing data retrieval strategy",
+                ],
+            }
+        )
+    )
+
+    if fc["name"] != "select_region":
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "error",
+                    "message": "Unknown function requested by Gemini.",
+                }
+            )
+        )
+        return None
+
+    mode = args.get("mode")
+    date_min = args.get("date_min")
+    date_max = args.get("date_max")
+    variables = args.get("variables", [])
+    if mode not in ("box", "points"):
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "error",
+                    "message": f"Unknown mode from Gemini: {mode}",
+                }
+            )
+        )
+        return None
+
+    # Build query meta (normalized date range) to send back to frontend
+    nm_start, nm_end = normalize_date_range(date_min, date_max)
+    query_meta = {
+        "mode": mode,
+        "date_min_provided": date_min,
+        "date_max_provided": date_max,
+        "date_start": nm_start,
+        "date_end": nm_end,
+        "selected_variables": variables,
+        "region_source": (
+            "gazetteer"
+            if parsed_args is not None
+            else "semantic_cache"
+            if cached_call is not None
+            else "gemini"
+        ),
+    }
+
+    if stream:
+
+        async def fetch_box(b):
+            return await stream_region_result(
+                ws, request_id, "box", b, date_min, date_max, variables, wire_format
+            )
+
+        async def fetch_points(p):
+            return await stream_region_result(
+                ws, request_id, "points", p, date_min, date_max, variables, wire_format
+            )
+
+    else:
+
+        async def fetch_box(b):
+            if speculation is not None and speculation["key"] == box_flight_key(
+                b, date_min, date_max, variables
+            ):
+                # Shielded: a hedged fetch may cancel this call
+                return await asyncio.shield(speculation["task"])
+            return await fetch_box_shared(b, date_min, date_max, variables)
+
+        async def fetch_points(p):
+            return await fetch_points_shared(p, date_min, date_max, variables)
+
+    async def fetch() -> Dict[str, Any]:
+        # Stage 3: Fetching from DB
+        print(
+            f"Fetching data for mode: {mode}, date_min: {date_min}, date_max: {date_max}, args: {args}"
+        )
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "db_fetch",
+                    "message": "📡 Fetching data from PostgreSQL",
+                    "thinking": [
+                        "Connecting to Argo global database",
+                        "Querying ocean float measurements",
+                        "Filtering by geographical region",
+                        "Applying time range constraints",
+                        "Retrieving temperature, salinity, and pressure data",
+                        "Validating data quality and completeness",
+                        "Organizing results by location and time",
+                    ],
+                }
+            )
+        )
+
+        if mode == "box":
+            box = args.get("box")
+            if not box:
+                raise ValueError("Gemini returned mode 'box' but no box provided")
+            query_meta["requested_box"] = box
+
+            # Aggregate questions are answered from the
+            # climatology cube when it covers the box
+            raw_result = None
+            if args.get("aggregate"):
+                raw_result = climatology_result(box, date_min, date_max, variables)
+            if raw_result is not None:
+                query_meta["box"] = box
+                query_meta["source"] = "climatology"
+                query_meta["climatology"] = raw_result["depth_stats"]["climatology"]
+            else:
+                # The coverage index knows where profiles are:
+                # answer empty regions at once and widen sparse
+                # boxes just enough before fetching
+                plan = coverage_service.plan_box(box, date_min, date_max)
+                if plan is not None:
+                    query_meta["coverage"] = {
+                        "profiles": plan["profiles"],
+                        "margin_deg": plan["margin"],
+                    }
+                    if plan["box"] is None:
+                        raise FileNotFoundError(
+                            "No Argo profiles in this region and period"
+                        )
+                    used_box = plan["box"]
+                    fetch_path = "expanded" if plan["margin"] else "original"
+                    try:
+                        raw_result = await fetch_box(used_box)
+                    except FileNotFoundError:
+                        # The index count is an upper bound (it ignores
+                        # depth and QC), so a planned box can still come
+                        # back empty: widen it like an unplanned fetch
+                        print(f"Planned box {used_box} returned no data, broadening")
+                        coverage_service.counts["missed"] += 1
+                        raw_result, used_box, fetch_path = await hedged_box_fetch.run(
+                            fetch_box, used_box, None if stream else ARGO_HEDGE_DELAY
+                        )
+                else:
+                    # Try the original box, hedged with a broader
+                    # area if it is slow or finds nothing
+                    raw_result, used_box, fetch_path = await hedged_box_fetch.run(
+                        fetch_box, box, None if stream else ARGO_HEDGE_DELAY
+                    )
+                query_meta["box"] = used_box
+                query_meta["fetch_path"] = fetch_path
+                if fetch_path in ("broader", "expanded"):
+                    query_meta["expanded_search"] = True
+                    print(f"Successfully found data with broader search area")
+
+        else:
+            points = args.get("points", [])
+            if not points:
+                raise ValueError("Gemini returned mode 'points' but no points provided")
+            if coverage_service.points_empty(points, date_min, date_max):
+                raise FileNotFoundError(
+                    "No Argo profiles near these points in this period"
+                )
+            raw_result = await fetch_points(points)
+            query_meta["points"] = points
+
+        if stream:
+            await ws.send_text(
+                json.dumps(
+                    {
+                        "stage": "data_done",
+                        "request_id": request_id,
+                        "chunks": raw_result.get("chunks", 0),
+                        "total": raw_result.get("total"),
+                        "depth_stats": raw_result.get("depth_stats"),
+                        "query_meta": query_meta,
+                    },
+                    default=str,
+                    allow_nan=False,
+                )
+            )
+
+        # Stage 4: Processing data
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "processing",
+                    "message": "⚙️ Processing data",
+                    "thinking": [
+                        "Cleaning and validating ocean measurements",
+                        "Filtering data by requested variables",
+                        "Organizing results by location and time",
+                        "Preparing data for visualization",
+                        "Generating summary statistics",
+                        "Creating data quality reports",
+                        "Finalizing analysis results",
+                    ],
+                }
+            )
+        )
+        # result = process_data(raw_result)  # wrap your pandas/cleaning logic here
+
+        # Stage 5: Generate dynamic analysis
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "completed",
+                    "message": "✅ Generating analysis",
+                    "thinking": [
+                        "Finalizing data processing",
+                        "Preparing response format",
+                        "Generating user-friendly summary",
+                        "Ready to display results",
+                    ],
+                }
+            )
+        )
+        return raw_result
+
+    # Clients that opted in get the analysis text as analysis_delta
+    # messages while it is generated; the final message repeats it whole
+    async def send_analysis_delta(text: str) -> None:
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "analysis_delta",
+                    "request_id": request_id,
+                    "delta": text,
+                }
+            )
+        )
+
+    # Generate dynamic analysis using Gemini
+    async def analyze(fetch) -> str:
+        return await generate_data_analysis(
+            query,
+            fetch,
+            query_meta,
+            similar_chats,
+            on_delta=send_analysis_delta if analysis_deltas else None,
+        )
+
+    # Generate graph analysis for visualization
+    async def analyze_graph(fetch) -> Dict[str, Any]:
+        return generate_graph_analysis(fetch, query_meta)
+
+    async def respond(fetch, analysis, graph_analysis) -> None:
+        # raw_result may be shared with other sessions, so never mutate it
+        result = dict(fetch)
+        result["dynamic_analysis"] = (
+            analysis or "Analysis generation failed, showing data results."
+        )
+        result["graph_analysis"] = graph_analysis
+        if stream:
+            # The records went out as data_chunk messages already
+            await ws.send_text(
+                json.dumps(
+                    {
+                        "stage": "analysis",
+                        "request_id": request_id,
+                        "dynamic_analysis": result["dynamic_analysis"],
+                        "graph_analysis": graph_analysis,
+                        "query_meta": query_meta,
+                    },
+                    default=str,
+                    allow_nan=False,
+                )
+            )
+        else:
+            await send_payload(
+                ws,
+                {"stage": "result", "result": result, "query_meta": query_meta},
+                wire_format,
+            )
+
+    def store_chat(dynamic_analysis: str) -> None:
+        # Store user query and its dynamic analysis in Chroma DB
+        doc_id = str(uuid4())
+        chat_embeddings_collection.add(
+            ids=[doc_id],
+            documents=[dynamic_analysis],
+            metadatas=[
+                {
+                    "query": query,
+                    "timestamp": datetime.datetime.utcnow().isoformat(),
+                    "query_meta": json.dumps(query_meta),
+                    "id": doc_id,
+                }
+            ],
+        )
+        print(f"Stored analysis with ID: {doc_id}")
+        if query_meta["region_source"] == "gemini":
+            semantic_region_cache.store(query, conversation_history, args)
+
+        # Log similar chats found
+        if similar_chats:
+            print(f"Used context from {len(similar_chats)} similar previous queries")
+            for chat in similar_chats:
+                print(
+                    f"  - Similar: '{chat['query'][:50]}...' (similarity: {1 - chat['distance']:.2f})"
+                )
+
+    async def store(analysis) -> None:
+        if analysis is not None:
+            await loop.run_in_executor(None, store_chat, analysis)
+
+    pipeline = StageGraph("query")
+    pipeline.add("fetch", fetch)
+    pipeline.add("analysis", analyze, deps=["fetch"], required=False)
+    pipeline.add("graph_analysis", analyze_graph, deps=["fetch"], required=False)
+    pipeline.add("respond", respond, deps=["fetch", "analysis", "graph_analysis"])
+    pipeline.add("store", store, deps=["analysis"], required=False, background=True)
+    try:
+        await pipeline.run()
+    except (
+        FSTimeoutError,
+        asyncio.TimeoutError,
+        aiohttp.ClientError,
+        FileNotFoundError,
+    ) as exc:
+        # Soft-fail on network/data errors: return a friendly result instead of an error stage
+        error_type = (
+            "timeout"
+            if isinstance(exc, (FSTimeoutError, asyncio.TimeoutError))
+            else "no_data"
+        )
+
+        if error_type == "no_data":
+            friendly_message = (
+                "## No Data Found\n\n"
+                "No ocean data was found for your requested region and time period.\n\n"
+                "**Possible reasons:**\n"
+                "• Limited **Argo float** coverage in this region\n"
+                "• No measurements available in the specified time period\n"
+                "• Area is outside the main **Argo network**\n\n"
+                "**Solution:** Try expanding your search area or using a different time period."
+            )
+        else:
+            friendly_message = (
+                "## Timeout Error\n\n"
+                "The **ocean data source** timed out while fetching results.\n\n"
+                "**Solution:** Try a smaller date range or a narrower region, then try again."
+            )
+
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "result",
+                    "result": friendly_message,
+                    "query_meta": query_meta,
+                    **({"request_id": request_id} if stream else {}),
+                },
+                allow_nan=False,
+            )
+        )
+    except WebSocketDisconnect:
+        raise
+    except Exception as exc:
+        tb = traceback.format_exc()
+        await ws.send_text(
+            json.dumps(
+                {
+                    "stage": "error",
+                    "message": f"Error during fetch/processing: {str(exc)}",
+                    "traceback": tb,
+                }
+            )
+        )
+    return query_meta
+
+
+# --- WebSocket endpoint ---
+@app.websocket("/ws")
+async def websocket_endpoint(ws: WebSocket):
+    await ws.accept()
+    try:
+        conversation_history = []
+        last_query_meta = None
+        session_id = str(uuid4())
+        wire_format = "json"
+        while True:
+            data = await ws.receive_text()
+            print(f"Received data: {data}")
+            try:
+                payload = json.loads(data)
+            except json.JSONDecodeError:
+                await ws.send_text(
+                    json.dumps({"error": 'Invalid JSON. Send {"query": "..."}'})
+                )
+                continue
+
+            # Wire format negotiation: {"action": "negotiate", "formats": [...]}
+            # picks the first format in WIRE_FORMATS the client supports
+            if payload.get("action") == "negotiate":
+                offered = payload.get("formats") or []
+                wire_format = next((f for f in WIRE_FORMATS if f in offered), "json")
+                await ws.send_text(
+                    json.dumps({"stage": "negotiated", "format": wire_format})
+                )
+                continue
+
+            # Variable toggle: the first result only carries the selected
+            # variables, so the full columns are fetched on demand. The
+            # client's request_id comes back on the reply.
+            if payload.get("action") == "fetch_full":
+                full_query_meta = payload.get("query_meta") or {}
+                full_request_id = payload.get("request_id")
+                try:
+                    full_result = await fetch_full_columns(full_query_meta)
+                    await send_payload(
+                        ws,
+                        {
+                            "stage": "full_data",
+                            "request_id": full_request_id,
+                            "result": full_result,
+                            "query_meta": full_query_meta,
+                        },
+                        wire_format,
+                    )
+                except Exception as exc:
+                    await ws.send_text(
+                        json.dumps(
+                            {
+                                "stage": "error",
+                                "request_id": full_request_id,
+                                "message": f"Error fetching full data: {str(exc)}",
+                            }
+                        )
+                    )
+                continue
+
+            query = payload.get("query")
+            conversation_history.append(query)
+            if not query:
+                await ws.send_text(json.dumps({"error": "Missing 'query' in payload."}))
+                continue
+
+            # Clients that send "stream": true get data_chunk/data_done/analysis
+            # messages tagged with request_id instead of one final result
+            stream = bool(payload.get("stream"))
+            request_id = str(payload.get("request_id") or uuid4())
+            # analysis_delta messages: always when streaming, and on request
+            # for clients that still want the single result message
+            analysis_deltas = stream or bool(payload.get("analysis_deltas"))
+
+            last_query_meta = await handle_query(
+                ws,
+                query,
+                list(conversation_history),
+                stream,
+                request_id,
+                wire_format,
+                last_query_meta,
+                analysis_deltas,
+            )
+
+    except WebSocketDisconnect:
+        print("Client disconnected")
+
+
+@app.on_event("startup")
+async def start_data_source():
+    await data_source.start()
+    coverage_service.start()
+    prefetch_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def close_data_source():
+    await prefetch_scheduler.stop()
+    await coverage_service.stop()
+    await data_source.close()
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "data_source": data_source.stats(),
+        "climatology": climatology_cube.stats() if climatology_cube else None,
+        "argo_cache": argo_cache.stats(),
+        "single_flight": fetch_single_flight.stats(),
+        "prefetch": prefetch_scheduler.stats(),
+        "box_fetch": hedged_box_fetch.stats(),
+        "coverage": coverage_service.stats(),
+        "gemini": gemini.stats(),
+        "semantic_cache": semantic_region_cache.stats(),
+        "stages": stage_stats.stats(),
+        "speculative_fetch": speculative_fetch.stats(),
+        "gazetteer": region_parser.stats(),
+    }
 
 
 # --- Simple index for manual testing ---
@@ -54,9 +54,7 @@ interface OceanDataResult {
     point: { lat: number; lon: number };
     error?: string;
     summary?: OceanDataSummary[];
-    full_summary?: OceanDataSummary[];
   }>;
-  full_summary?: OceanDataSummary[];
   graph_analysis?: GraphAnalysis;
 }
 
@@ -76,19 +74,37 @@ export interface WebSocketResponse {
   traceback?: string;
   thinking?: string[];
   query_meta?: QueryMeta;
+  request_id?: string;
+  delta?: string;
 }
 
+// Rows for the results table: the box summary, or the first point with data
+const pickTableData = (result: OceanDataResult | null | undefined): Array<TableDataRow> | undefined => {
+  if (result && Array.isArray(result.summary) && result.summary.length > 0 && typeof result.summary[0] === 'object') {
+    return result.summary as Array<TableDataRow>;
+  }
+  if (Array.isArray(result?.summaries)) {
+    const firstWithData = result.summaries.find((s) => Array.isArray(s?.summary) && s.summary.length > 0 && typeof s.summary[0] === 'object');
+    if (firstWithData) {
+      return firstWithData.summary as Array<TableDataRow>;
+    }
+  }
+  return undefined;
+};
+
 export function ChatInterface() {
   const [loadingState, setLoadingState] = useState<LoadingState>({ isLoading: false });
   const [activeTab, setActiveTab] = useState<'answer' | 'sources' | 'graph' | 'steps'>('answer');
   const [currentThinkingSteps, setCurrentThinkingSteps] = useState<string[]>([]);
+  // Analysis text received so far from analysis_delta messages
+  const [pendingAnalysis, setPendingAnalysis] = useState<string>("");
   const lastSentUserMessageIdRef = useRef<string | null>(null);
   
   // Use the global websocket context
   const { connectionStatus, isConnected, sendMessage: wsSendMessage, onMessage, onError, onClose } = useWebSocket();
   
   // Use the chat context
-  const { activeChat, addMessageToChat } = useChat();
+  const { activeChat, addMessageToChat, updateMessageInChat } = useChat();
   
   // Get messages from the active chat
   const messages = useMemo(() => activeChat?.messages || [], [activeChat?.messages]);
@@ -213,25 +229,15 @@ export function ChatInterface() {
             }
             break;
             
+          case "analysis_delta":
+            // Sent while the analysis is generated, since we ask for analysis_deltas
+            setPendingAnalysis(prev => prev + (data.delta || ""));
+            break;
+
           case "result":
             console.log("📋 Stage: Final result received");
             const resultPayload = data.result;
-            // Prefer single summary table if present
-            let tableData: Array<TableDataRow> | undefined =
-              resultPayload &&
-              Array.isArray(resultPayload.summary) &&
-              resultPayload.summary.length > 0 &&
-              typeof resultPayload.summary[0] === 'object'
-                ? (resultPayload.summary as Array<TableDataRow>)
-                : undefined;
-
-            // Otherwise, if summaries array exists (multi-point), pick the first non-empty summary
-            if (!tableData && Array.isArray(resultPayload?.summaries)) {
-              const firstWithData = resultPayload.summaries.find((s) => Array.isArray(s?.summary) && s.summary.length > 0 && typeof s.summary[0] === 'object');
-              if (firstWithData) {
-                tableData = firstWithData.summary as Array<TableDataRow>;
-              }
-            }
+            const tableData = pickTableData(resultPayload);
 
             console.log("💾 Creating assistant message with thinking steps:", currentThinkingSteps);
             const assistant: Message = {
@@ -240,17 +246,6 @@ export function ChatInterface() {
               content: formatResultForDisplay(resultPayload),
               timestamp: new Date().toISOString(),
               tableData,
-              fullTableData: (() => {
-                // If backend included a full_summary, surface it for toggle
-                if (resultPayload && Array.isArray(resultPayload.full_summary)) {
-                  return resultPayload.full_summary as Array<TableDataRow>;
-                }
-                if (Array.isArray(resultPayload?.summaries)) {
-                  const firstWithFull = resultPayload.summaries.find((s) => Array.isArray(s?.full_summary));
-                  if (firstWithFull) return firstWithFull.full_summary as Array<TableDataRow>;
-                }
-                return undefined;
-              })(),
               queryMeta: data.query_meta,
               thinkingSteps: [...currentThinkingSteps],
               sources: [
@@ -268,10 +263,25 @@ export function ChatInterface() {
             }
             setLoadingState({ isLoading: false });
             setCurrentThinkingSteps([]); // Reset thinking steps after message is created
+            setPendingAnalysis("");
             break;
             
+          case "full_data":
+            // Reply to the "Re-fetch all columns" toggle, tagged with the message id
+            console.log("📋 Stage: All columns received for", data.request_id);
+            if (activeChat && data.request_id) {
+              updateMessageInChat(activeChat.id, data.request_id, {
+                fullTableData: pickTableData(data.result) || [],
+              });
+            }
+            break;
+
           case "error":
             console.error("❌ Stage: Error occurred");
+            // A failed "Re-fetch all columns" request stops its toggle from loading
+            if (activeChat && data.request_id) {
+              updateMessageInChat(activeChat.id, data.request_id, { fullTableData: [] });
+            }
             const errorMessage: Message = {
               id: crypto.randomUUID(),
               role: "assistant",
@@ -286,6 +296,7 @@ export function ChatInterface() {
             }
             setLoadingState({ isLoading: false });
             setCurrentThinkingSteps([]); // Reset thinking steps after message is created
+            setPendingAnalysis("");
             break;
             
           case "no_function_call":
@@ -304,6 +315,7 @@ export function ChatInterface() {
             }
             setLoadingState({ isLoading: false });
             setCurrentThinkingSteps([]); // Reset thinking steps after message is created
+            setPendingAnalysis("");
             break;
             
           default:
@@ -399,7 +411,17 @@ export function ChatInterface() {
       
       setLoadingState({ isLoading: false });
     });
-  }, [onMessage, onError, onClose, connectionStatus, currentThinkingSteps, activeChat, addMessageToChat]);
+  }, [onMessage, onError, onClose, connectionStatus, currentThinkingSteps, activeChat, addMessageToChat, updateMessageInChat]);
+
+  // The first result only has the selected variables; fetch every column on demand
+  const requestFullData = (message: Message) => {
+    if (!message.queryMeta || !isConnected) return;
+    try {
+      wsSendMessage({ action: "fetch_full", request_id: message.id, query_meta: message.queryMeta });
+    } catch (error) {
+      console.error("Failed to request all columns:", error);
+    }
+  };
 
   const sendMessage = async (text: string) => {
     // Ensure we have an active chat
@@ -420,6 +442,7 @@ export function ChatInterface() {
     lastSentUserMessageIdRef.current = userMsg.id;
     setLoadingState({ isLoading: true, stage: "analyzing" });
     setCurrentThinkingSteps([]); // Reset thinking steps for new query
+    setPendingAnalysis("");
     setActiveTab('answer'); // Reset to answer tab for new queries
     
     // Ensure connection status is connected before sending
@@ -432,10 +455,10 @@ export function ChatInterface() {
     try {
       console.group("📤 Sending WebSocket Message");
       console.log("Query:", text);
-      console.log("Message object:", { query: text });
+      console.log("Message object:", { query: text, analysis_deltas: true });
       console.groupEnd();
       
-      wsSendMessage({ query: text });
+      wsSendMessage({ query: text, analysis_deltas: true });
     } catch (error) {
       console.error("Failed to send message:", error);
       setLoadingState({ isLoading: false });
@@ -567,13 +590,20 @@ export function ChatInterface() {
             <div className="max-w-4xl mx-auto px-6 py-8 space-y-8">
               {messages.map((msg, index) => (
                 <div key={msg.id} id={`msg-${msg.id}`}>
-                  <ChatMessage message={msg} activeTab={activeTab} setActiveTab={setActiveTab} />
+                  <ChatMessage message={msg} activeTab={activeTab} setActiveTab={setActiveTab} onRequestFull={requestFullData} />
                   {index < messages.length - 1 && (
                     <Separator className="my-8 opacity-50" />
                   )}
                 </div>
               ))}
-              {loadingState.isLoading && (
+              {loadingState.isLoading && pendingAnalysis && (
+                <ChatMessage
+                  message={{ id: "pending-analysis", role: "assistant", content: pendingAnalysis, timestamp: new Date().toISOString() }}
+                  activeTab="answer"
+                  setActiveTab={setActiveTab}
+                />
+              )}
+              {loadingState.isLoading && !pendingAnalysis && (
                 <LoadingIndicator stage={loadingState.stage} thinking={loadingState.thinking} />
               )}
             </div>
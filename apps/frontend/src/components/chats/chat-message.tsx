@@ -25,11 +25,13 @@ import { OceanDataGraph, OceanDataPoint, GraphAnalysis as OceanGraphAnalysis } f
 export function ChatMessage({ 
   message, 
   activeTab, 
-  setActiveTab 
+  setActiveTab,
+  onRequestFull
 }: { 
   message: Message;
   activeTab: 'answer' | 'sources' | 'graph' | 'steps';
   setActiveTab: (tab: 'answer' | 'sources' | 'graph' | 'steps') => void;
+  onRequestFull?: (message: Message) => void;
 }) {
   const [copied, setCopied] = useState(false);
   const [isHovered, setIsHovered] = useState(false);
@@ -262,8 +264,9 @@ export function ChatMessage({
           {Array.isArray(message.tableData) && message.tableData.length > 0 && (
             <div className="mt-4">
               {(() => {
-                // Enable toggle if we detect full_summary in message content structure
-                const hasFull = !!message?.queryMeta; // meta always present
+                // All columns are fetched from the backend the first time they're shown
+                const hasFull = !!message?.queryMeta && !!onRequestFull;
+                const loadingFull = showFull && !Array.isArray(message.fullTableData);
                 return (
                   <div className="flex items-center justify-between mb-3">
                     <div className="font-semibold text-foreground">Data Results</div>
@@ -272,16 +275,22 @@ export function ChatMessage({
                         size="sm"
                         variant="outline"
                         className="h-8 px-3 rounded-md text-xs"
-                        onClick={() => setShowFull((v) => !v)}
+                        title="Re-fetches the query with every column; the sampled profiles can differ from the filtered view"
+                        onClick={() => {
+                          if (!showFull && !Array.isArray(message.fullTableData)) {
+                            onRequestFull?.(message);
+                          }
+                          setShowFull((v) => !v);
+                        }}
                       >
-                        {showFull ? "Show filtered columns" : "Show all columns"}
+                        {loadingFull ? "Loading all columns..." : showFull ? "Show filtered columns" : "Re-fetch all columns"}
                       </Button>
                     )}
                   </div>
                 );
               })()}
               {(() => {
-                // If showFull is true and backend provided full_summary, use it
+                // Until the full columns arrive, keep showing the filtered ones
                 const full: Array<Record<string, unknown>> | undefined = message.fullTableData;
                 const dataset = showFull && Array.isArray(full) && full.length > 0 ? full : message.tableData;
                 const rows = dataset.slice(0, 50);
@@ -26,6 +26,8 @@ interface ChatContextType {
   updateChatTitle: (chatId: string, title: string) => void;
   /** Adds a message to a specific chat */
   addMessageToChat: (chatId: string, message: Message) => void;
+  /** Updates fields of a message in a specific chat */
+  updateMessageInChat: (chatId: string, messageId: string, changes: Partial<Message>) => void;
   /** Deletes a chat by ID */
   deleteChat: (chatId: string) => void;
   /** Clears all chats */
@@ -119,6 +121,19 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     }));
   };
 
+  const updateMessageInChat = (chatId: string, messageId: string, changes: Partial<Message>) => {
+    setChats(prev => prev.map(chat =>
+      chat.id === chatId
+        ? {
+            ...chat,
+            messages: chat.messages.map(message =>
+              message.id === messageId ? { ...message, ...changes } : message
+            ),
+          }
+        : chat
+    ));
+  };
+
   const deleteChat = (chatId: string) => {
     setChats(prev => {
       const filtered = prev.filter(chat => chat.id !== chatId);
@@ -151,6 +166,7 @@ export function ChatProvider({ children }: { children: ReactNode }) {
     switchToChat,
     updateChatTitle,
     addMessageToChat,
+    updateMessageInChat,
     deleteChat,
     clearAllChats,
   };
@@ -1,13 +1,13 @@
 "use client";
 
 import React, { createContext, useContext, useEffect, useRef, useState, ReactNode } from 'react';
-import { WebSocketService, WebSocketResponse } from '../lib/websocket';
+import { WebSocketService, WebSocketResponse, WebSocketMessage } from '../lib/websocket';
 
 interface WebSocketContextType {
   wsService: WebSocketService | null;
   connectionStatus: 'connecting' | 'connected' | 'disconnected';
   isConnected: boolean;
-  sendMessage: (message: { query: string }) => void;
+  sendMessage: (message: WebSocketMessage) => void;
   onMessage: (callback: (data: WebSocketResponse) => void) => void;
   onError: (callback: (error: Event | Error) => void) => void;
   onClose: (callback: (event: CloseEvent) => void) => void;
@@ -61,7 +61,7 @@ export function WebSocketProvider({ children }: WebSocketProviderProps) {
     };
   }, []);
 
-  const sendMessage = (message: { query: string }) => {
+  const sendMessage = (message: WebSocketMessage) => {
     if (wsServiceRef.current && wsServiceRef.current.isConnected()) {
       wsServiceRef.current.sendMessage(message);
     } else {
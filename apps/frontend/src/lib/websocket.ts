@@ -1,5 +1,11 @@
 export interface WebSocketMessage {
-  query: string;
+  query?: string;
+  // Receive the analysis as analysis_delta messages while it is generated
+  analysis_deltas?: boolean;
+  // {"action": "fetch_full"} asks for every column of an earlier result
+  action?: string;
+  query_meta?: Record<string, unknown>;
+  request_id?: string;
 }
 
 export interface WebSocketResponse {